@@ -0,0 +1,198 @@
+#Benchmark suite for the data processing pipeline, driven by synthetic ED stand data
+#Times each stage across a range of experiment sizes and the start up time of the program, compares the timings against a stored baseline, and checks the metrics against golden outputs
+#Usage: python3 benchmark.py [--save-baseline] [--save-golden]
+
+#Import packages from pip
+from typing import List, Callable
+import numpy
+import pandas as pd
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+#Import project files
+from synthetic_data import GenerateExperiment
+from step_detection import DetectSteps
+from experiment_meta import ExperimentMeta
+from metrics_store import MetricsStore
+from ed_analysis_manager import EDAnalysisManager
+from report_writer import ReportWriter
+
+#Synthetic experiments whose metrics are checked against the golden file
+GOLDEN_EXPERIMENTS: List[dict] = [
+	{"label" : "Golden A", "hours" : 6.0, "steps" : 6, "noise" : 0.01, "seed" : 0},
+	{"label" : "Golden B", "hours" : 12.0, "steps" : 12, "noise" : 0.02, "seed" : 1}
+]
+GOLDEN_RELATIVE_TOLERANCE: float = 1e-6
+
+#Commands whose start up time is measured, each run in a fresh interpreter so that nothing is already imported
+IMPORT_COMMANDS: dict = {
+	"Startup@main --help" : ["main.py", "--help"],
+	"Startup@main --config-gen" : ["main.py", "--config-gen"],
+	"Import@ed_analysis_manager" : ["-c", "import ed_analysis_manager"]
+}
+
+
+#Returns the best wall time in seconds of `repeat` calls to function
+def TimeFunction(function: Callable[[], None], repeat: int) -> float:
+	best: float = float("inf")
+	for n in range(0, repeat):
+		start: float = time.perf_counter()
+		function()
+		best = min(best, time.perf_counter() - start)
+	return best
+
+
+def NewExperiment(label: str) -> ExperimentMeta:
+	exp: ExperimentMeta = ExperimentMeta.__new__(ExperimentMeta)
+	exp.InitialiseMembers(label, 0.0, 0.0)
+	return exp
+
+def AnalyseSynthetic(label: str, rawData: pd.DataFrame) -> ExperimentMeta:
+	exp: ExperimentMeta = NewExperiment(label)
+	EDAnalysisManager.AnalyseExperiment(exp, rawData)
+	return exp
+
+
+#Times each stage of the pipeline. Returns a dict mapping "stage@size" to seconds
+def RunTimings(sizes: List[float], experimentCounts: List[int], repeat: int) -> dict:
+	timings: dict = {}
+
+	for hours in sizes:
+		rawData: pd.DataFrame = GenerateExperiment(hours=hours, steps=max(int(hours), 6))
+		timings["DetectSteps@%gh" % hours] = TimeFunction(lambda: DetectSteps(rawData["current_PSU001"]), repeat)
+		timings["AnalyseExperiment@%gh" % hours] = TimeFunction(lambda: AnalyseSynthetic("Benchmark", rawData), repeat)
+
+	#Plotting only depends on the number of processed windows, so reuse one processed experiment under several labels
+	processed: MetricsStore = AnalyseSynthetic("Benchmark", GenerateExperiment(hours=6.0, steps=6)).processedData
+	with tempfile.TemporaryDirectory() as directory:
+		for count in experimentCounts:
+			stores: List[MetricsStore] = []
+			for n in range(0, count):
+				store: MetricsStore = MetricsStore.FromDataFrame(processed.ToDataFrame())
+				store.categories["label"] = ["Experiment %d" % n]
+				stores.append(store)
+
+			reportWriter: ReportWriter = ReportWriter(os.path.join(directory, "out.html"), "cdn")
+			timings["Concatenate@%dexp" % count] = TimeFunction(lambda: MetricsStore.Concatenate(stores), repeat)
+			allProcessedData: pd.DataFrame = MetricsStore.Concatenate(stores)
+			timings["PlotData@%dexp" % count] = TimeFunction(lambda: reportWriter.Write(reportWriter.RenderBarFigures(allProcessedData)), repeat)
+
+	return timings
+
+
+#Times how long each of IMPORT_COMMANDS takes to run in a new Python process. Returns a dict mapping the name of each command to seconds
+def RunImportTimings(repeat: int) -> dict:
+	timings: dict = {}
+	projectDirectory: str = os.path.dirname(os.path.abspath(__file__))
+	with tempfile.TemporaryDirectory() as directory:
+		for name, arguments in IMPORT_COMMANDS.items():
+			#Scripts are run from the project directory, but in an empty working directory, so that --config-gen doesn't overwrite a config file
+			arguments = [os.path.join(projectDirectory, argument) if argument.endswith(".py") else argument for argument in arguments]
+			environment: dict = dict(os.environ, PYTHONPATH=projectDirectory)
+			timings[name] = TimeFunction(lambda: subprocess.run([sys.executable] + arguments, cwd=directory, env=environment, stdout=subprocess.DEVNULL, check=True), repeat)
+	return timings
+
+
+#Compares timings against a baseline. Returns the names of stages that are slower than the baseline by more than the tolerance
+def CompareTimings(timings: dict, baseline: dict, tolerance: float) -> List[str]:
+	regressions: List[str] = []
+	print ("%-28s %12s %12s %8s" % ("Stage", "Time / s", "Baseline / s", "Ratio"), file=sys.stderr)
+	for stage, seconds in timings.items():
+		if stage in baseline:
+			ratio: float = seconds / baseline[stage]
+			flag: str = ""
+			if ratio > 1.0 + tolerance:
+				regressions.append(stage)
+				flag = "  REGRESSION"
+			print ("%-28s %12.4f %12.4f %8.2f%s" % (stage, seconds, baseline[stage], ratio, flag), file=sys.stderr)
+		else:
+			print ("%-28s %12.4f %12s %8s" % (stage, seconds, "-", "-"), file=sys.stderr)
+	return regressions
+
+
+#Processes the golden experiments and returns their metrics as a DataFrame
+def GoldenMetrics() -> pd.DataFrame:
+	stores: List[MetricsStore] = []
+	for spec in GOLDEN_EXPERIMENTS:
+		rawData: pd.DataFrame = GenerateExperiment(hours=spec["hours"], steps=spec["steps"], noise=spec["noise"], seed=spec["seed"])
+		stores.append(AnalyseSynthetic(spec["label"], rawData).processedData)
+	return MetricsStore.Concatenate(stores)
+
+#Returns a list of differences between the calculated and golden metrics. Empty if they match
+def CompareGolden(metrics: pd.DataFrame, golden: dict) -> List[str]:
+	differences: List[str] = []
+	if len(metrics) != len(golden["label"]):
+		return ["expected %d windows, found %d" % (len(golden["label"]), len(metrics))]
+	for column, expected in golden.items():
+		if column == "label":
+			if [str(label) for label in metrics[column]] != expected:
+				differences.append(column)
+		elif not numpy.allclose(metrics[column].to_numpy(dtype=numpy.float64), numpy.asarray(expected, dtype=numpy.float64), rtol=GOLDEN_RELATIVE_TOLERANCE, atol=0.0, equal_nan=True):
+			differences.append(column)
+	return differences
+
+
+def LoadJSON(filename: str) -> dict:
+	with open(filename, 'r', encoding="utf-8") as Reader:
+		return json.load(Reader)
+
+def SaveJSON(data: dict, filename: str) -> None:
+	with open(filename, 'w', encoding="utf-8") as Writer:
+		json.dump(data, Writer, indent=1)
+
+
+if __name__ == "__main__":
+	#Configure argparse for handling command line arguments
+	parser: argparse.ArgumentParser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+	parser.add_argument("--sizes", action="store", type=float, nargs='+', default=[6.0, 24.0, 96.0], help="Lengths of the synthetic experiments to process, in hours")
+	parser.add_argument("--experiments", action="store", type=int, nargs='+', default=[5, 20, 50], help="Numbers of experiments to plot")
+	parser.add_argument("--repeat", action="store", type=int, default=3, help="Number of times each stage is timed. The best time is reported")
+	parser.add_argument("--baseline", action="store", default="benchmark_baseline.json", help="File containing baseline timings to compare against")
+	parser.add_argument("--save-baseline", action="store_true", help="Save the timings of this run as the new baseline")
+	parser.add_argument("--tolerance", action="store", type=float, default=0.25, help="Fraction by which a stage may be slower than the baseline before it counts as a regression")
+	parser.add_argument("--golden", action="store", default="benchmark_golden.json", help="File containing golden metric outputs")
+	parser.add_argument("--save-golden", action="store_true", help="Save the metrics of this run as the new golden outputs")
+	parser.add_argument("--output", action="store", help="Also write the timings of this run to a JSON file")
+	config: dict = vars(parser.parse_args())
+
+	failed: bool = False
+
+	#Correctness checks
+	metrics: pd.DataFrame = GoldenMetrics()
+	if config["save_golden"]:
+		golden: dict = {column : [str(value) for value in metrics[column]] if column == "label" else metrics[column].tolist() for column in metrics.columns}
+		SaveJSON(golden, config["golden"])
+		print ("Saved golden outputs to %s" % config["golden"], file=sys.stderr)
+	elif os.path.isfile(config["golden"]):
+		differences: List[str] = CompareGolden(metrics, LoadJSON(config["golden"]))
+		if differences:
+			print ("Golden check FAILED: %s" % ", ".join(differences), file=sys.stderr)
+			failed = True
+		else:
+			print ("Golden check passed", file=sys.stderr)
+	else:
+		print ("Warning: no golden outputs found at %s, skipping correctness checks" % config["golden"], file=sys.stderr)
+
+	#Performance checks
+	timings: dict = RunTimings(config["sizes"], config["experiments"], config["repeat"])
+	timings.update(RunImportTimings(config["repeat"]))
+	baseline: dict = {}
+	if os.path.isfile(config["baseline"]) and not config["save_baseline"]:
+		baseline = LoadJSON(config["baseline"])
+	regressions: List[str] = CompareTimings(timings, baseline, config["tolerance"])
+	if regressions:
+		print ("Performance regressions in: %s" % ", ".join(regressions), file=sys.stderr)
+		failed = True
+
+	if config["save_baseline"]:
+		SaveJSON(timings, config["baseline"])
+		print ("Saved baseline timings to %s" % config["baseline"], file=sys.stderr)
+	if config["output"]:
+		SaveJSON(timings, config["output"])
+
+	sys.exit(1 if failed else 0)
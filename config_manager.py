@@ -1,20 +1,55 @@
+from typing import List
+
+#Config options that are parsed as booleans rather than strings
+BOOLEAN_KEYS: tuple = ("exclude", "refresh", "stream", "parallel_render", "pushdown", "facet_by_stand", "timeseries")
+#Config options that can be set separately for each report of a job file. Every other option is shared by all of the reports
+REPORT_KEYS: tuple = ("output", "experimentIDs", "exclude", "metrics_out", "plotlyjs", "parallel_render", "facet_by_stand", "since", "until", "match", "on_stand")
+
 def ConfigGen() -> None:
 	with open("ed_data_analysis.conf", 'w', encoding="utf-8") as Writer:
 		Writer.write("""\
 #Lines beginning in a \'#\' will be ignored. Empty strings will be ignored.
 #dashboard:
 #output: out.html
-#exclude: False"""
+#metrics_out:
+#plotlyjs: inline
+#parallel_render: False
+#timeseries: False
+#max_points: 2000
+#exclude: False
+#since:
+#until:
+#match:
+#on_stand:
+#source: live
+#replay_dir:
+#location: arches
+#stand: ED002
+#facet_by_stand: False
+#record:
+#refresh: False
+#cache_dir: .ed_cache
+#cache_size: 1024
+#notion_ttl: 300
+#results_dir: .ed_cache/results
+#jobs: 4
+#batch_gap: 600
+#batch_span: 24
+#batch_rows: 20000
+#processes: 0
+#stream: False
+#memory_budget: 256
+#pushdown: False
+#watch:
+#poll_interval: 10
+#job_file:
+#profile:"""
 	       )
 
 #Dependency for LoadConfig
+#Only strips whitespace from the ends of a string, as values such as "since: 2024-07-01 09:30" or "match: Amine 2" can contain spaces
 def StripWhitespace(ip: str) -> str:
-	whitespace: str = " \t\n"
-	op: str = ""
-	for n in range(0, len(ip)):
-		if not (ip[n] in whitespace):
-			op += ip[n]
-	return op
+	return ip.strip(" \t\n")
 
 #Dependency for LoadConfig
 #Returns the index of the first colon in a string
@@ -35,13 +70,13 @@ def LoadConfig(config: dict) -> None:
 	while line:
 		line = StripWhitespace(line)
 		#So that hashtags can be used to denote comments in the config file
-		if line[0] != '#':
+		if line and line[0] != '#':
 			colonIndex: int = FirstColonIndex(line)
-			key: str = line[0 : colonIndex]
-			val: str = line[colonIndex + 1 :]
+			key: str = StripWhitespace(line[0 : colonIndex])
+			val: str = StripWhitespace(line[colonIndex + 1 :])
 
 			if (not config[key]) and val:#First evaluation checks if the key has already been set (as command line arguments should override the config file). Second checks that the value in the config file exists and isn't a null string
-				if key == "exclude":
+				if key in BOOLEAN_KEYS:
 					#Convert argument from string to boolean
 					config[key] = val.lower() != "false"
 				else:
@@ -50,3 +85,54 @@ def LoadConfig(config: dict) -> None:
 		line = Reader.readline()
 
 	Reader.close()
+
+
+#Loads a job file, which describes several reports that are written by one run
+#Lines before the first [name] header set options shared by every report, in the same format as a config file, and don't override command line arguments. Options that are still at their default value in defaults can be overridden
+#Each [name] header starts a report. Its lines set options in REPORT_KEYS for that report only. experimentIDs is a comma separated list
+#Returns a config dict for each report. Reports select all completed experiments, and are written to <name>.html, unless their options say otherwise
+def LoadJobFile(config: dict, defaults: dict = {}) -> List[dict]:
+	sharedOptions: dict = {}
+	reports: List[tuple] = []
+
+	with open(config["job_file"], "r", encoding="utf-8") as Reader:
+		for line in Reader:
+			line = StripWhitespace(line)
+			#So that hashtags can be used to denote comments in the job file
+			if not line or line[0] == '#':
+				continue
+			if line[0] == '[' and line[-1] == ']':
+				reports.append((StripWhitespace(line[1 : -1]), {}))
+				continue
+
+			colonIndex: int = FirstColonIndex(line)
+			key: str = StripWhitespace(line[0 : colonIndex])
+			val: str = StripWhitespace(line[colonIndex + 1 :])
+			if key not in config:
+				raise Exception("Error: unknown option \"%s\" in job file %s" % (key, config["job_file"]))
+			if key in BOOLEAN_KEYS:
+				val = val.lower() != "false"
+			elif key == "experimentIDs":
+				val = [StripWhitespace(experimentID) for experimentID in val.split(",") if StripWhitespace(experimentID)]
+
+			if not reports:
+				sharedOptions[key] = val
+			elif key in REPORT_KEYS:
+				reports[-1][1][key] = val
+			else:
+				raise Exception("Error: \"%s\" can't be set for a single report, so it must come before the first report of job file %s" % (key, config["job_file"]))
+
+	if not reports:
+		raise Exception("Error: job file %s doesn't contain any [report] sections" % config["job_file"])
+
+	#Shared options are applied like a config file, without overriding command line arguments
+	for key, val in sharedOptions.items():
+		if (not config[key] or (key in defaults and config[key] == defaults[key])) and val != "":
+			config[key] = val
+
+	reportConfigs: List[dict] = []
+	for name, options in reports:
+		reportConfig: dict = dict(config, output=name + ".html", experimentIDs=[], exclude=False)
+		reportConfig.update(options)
+		reportConfigs.append(reportConfig)
+	return reportConfigs
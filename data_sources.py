@@ -0,0 +1,436 @@
+from typing import List, Iterator, Tuple
+import numpy
+import pandas as pd
+import glob
+import os
+import threading
+import copy
+import sys
+
+#Import project files
+from influx_cache import InfluxCache
+from notion_snapshot import NotionSnapshot
+from profiling import PROFILER
+from ed_metric_calculations import EDMetrics, WINDOW_STATISTICS, REQUIRED_CHANNELS, CHANNEL_DTYPES
+from window_index import SortedTimes
+
+#Pluggable sources of experiment metadata (the dashboard) and of sensor data
+#EDAnalysisManager only talks to these interfaces, so the whole pipeline can run from Notion and InfluxDB, or from local recordings
+
+DASHBOARD_BASENAME: str = "dashboard"
+#Columns of the dashboard that hold dates, which need parsing when read from CSV
+DASHBOARD_DATE_COLUMNS: List[str] = ["Start Date & Time", "End Date & Time"]
+
+
+#Splits a channel (column) name such as "volumetric_flow_MFM001" into its InfluxDB field and component ID
+def SplitChannel(channel: str) -> Tuple[str, str]:
+	field, componentID = channel.rsplit("_", 1)
+	return (field, componentID)
+
+
+#Drops every column that the analysis doesn't use, such as InfluxDB's "result" and "table", and stores the channels in CHANNEL_DTYPES
+#"_time" is stored as datetime64 in UTC. The values of frames that are already compact aren't copied
+def CompactSensorData(rawData: pd.DataFrame) -> pd.DataFrame:
+	if "_time" not in rawData.columns:
+		return rawData
+	columns: List[str] = ["_time"] + [channel for channel in REQUIRED_CHANNELS if channel in rawData.columns]
+	compactData: pd.DataFrame = rawData[columns].astype({channel : CHANNEL_DTYPES[channel] for channel in columns[1:]}, copy=False)
+	compactData["_time"] = pd.to_datetime(compactData["_time"], utc=True)
+	return compactData
+
+
+#########################
+#EXPERIMENT METADATA
+#########################
+
+class MetadataSource(object):
+	#Returns the dashboard as a DataFrame with (at least) the "Experimental Name", "Label", "Completed", "Start Date & Time" and "End Date & Time" columns
+	def Load(self) -> pd.DataFrame:
+		raise NotImplementedError
+
+
+#Loads the dashboard from Notion, through a local snapshot that is synced incrementally
+class NotionMetadataSource(MetadataSource):
+	"""
+	Member variables:
+
+	NotionSnapshot notionSnapshot;
+	"""
+
+	def __init__(self, notionSnapshot: NotionSnapshot) -> None:
+		self.notionSnapshot: NotionSnapshot = notionSnapshot
+
+	def Load(self) -> pd.DataFrame:
+		return self.notionSnapshot.Load()
+
+
+#Loads a recorded dashboard from a dashboard.parquet or dashboard.csv file in a replay directory
+class ReplayMetadataSource(MetadataSource):
+	"""
+	Member variables:
+
+	char *replayDirectory;
+	"""
+
+	def __init__(self, replayDirectory: str) -> None:
+		self.replayDirectory: str = replayDirectory
+
+	def Load(self) -> pd.DataFrame:
+		parquetPath: str = os.path.join(self.replayDirectory, DASHBOARD_BASENAME + ".parquet")
+		csvPath: str = os.path.join(self.replayDirectory, DASHBOARD_BASENAME + ".csv")
+		if os.path.isfile(parquetPath):
+			return pd.read_parquet(parquetPath)
+		if os.path.isfile(csvPath):
+			dashboard: pd.DataFrame = pd.read_csv(csvPath)
+			for column in DASHBOARD_DATE_COLUMNS:
+				dashboard[column] = pd.to_datetime(dashboard[column])
+			dashboard["Completed"] = dashboard["Completed"].astype(bool)
+			return dashboard
+		raise Exception("Error: no %s.parquet or %s.csv file was found in %s" % (DASHBOARD_BASENAME, DASHBOARD_BASENAME, self.replayDirectory))
+
+
+#Passes the dashboard through from another source, saving a copy into a replay directory
+class RecordingMetadataSource(MetadataSource):
+	"""
+	Member variables:
+
+	MetadataSource source;
+	char *recordDirectory;
+	"""
+
+	def __init__(self, source: MetadataSource, recordDirectory: str) -> None:
+		self.source: MetadataSource = source
+		self.recordDirectory: str = recordDirectory
+		os.makedirs(self.recordDirectory, exist_ok=True)
+
+	def Load(self) -> pd.DataFrame:
+		dashboard: pd.DataFrame = self.source.Load()
+		#Notion columns such as multi-selects hold lists, which are stored as their string representation
+		recording: pd.DataFrame = dashboard.copy()
+		for column in recording.columns:
+			if recording[column].dtype == object and recording[column].map(lambda value: isinstance(value, (list, dict))).any():
+				recording[column] = recording[column].astype(str)
+		recording.to_parquet(os.path.join(self.recordDirectory, DASHBOARD_BASENAME + ".parquet"), index=False)
+		return dashboard
+
+
+#########################
+#SENSOR DATA
+#########################
+
+class SensorDataSource(object):
+	#Length in seconds of the windows that rows are aggregated over
+	aggregationWindow: int = 10
+
+	#Returns the pivoted sensor data for the time range (startTime, stopTime], in UNIX seconds, with one row per aggregation window and a "_time" column
+	#Only the "_time" column and REQUIRED_CHANNELS are returned, in the dtypes of CompactSensorData()
+	def Query(self, startTime: int, stopTime: int) -> pd.DataFrame:
+		raise NotImplementedError
+
+	#Same as Query(), but yields the rows in one or more frames, in chronological order. Sources that can parse the response as it arrives override this, so that all of it is never held in memory at once
+	def QueryStream(self, startTime: int, stopTime: int) -> Iterator[pd.DataFrame]:
+		yield self.Query(startTime, stopTime)
+
+	#Same as Query(), but only returns the "_time" column and the given channels. Sources that can filter on the server override this to transfer less data
+	def QueryChannels(self, startTime: int, stopTime: int, channels: List[str]) -> pd.DataFrame:
+		rawData: pd.DataFrame = self.Query(startTime, stopTime)
+		return rawData[["_time"] + [channel for channel in channels if channel in rawData.columns]]
+
+	#Returns a dict of WINDOW_STATISTICS for each window, given as [start, stop] times in int64 nanoseconds that include both ends
+	#Windows without any data are returned as None. Sources that can aggregate on the server override this, so that the rows of the windows are never transferred
+	def QueryWindowStatistics(self, windows: List[Tuple[int, int]]) -> List[dict]:
+		statistics: List[dict] = []
+		for windowStart, windowStop in windows:
+			#Query() takes whole seconds and excludes the start of the range, so widen it and cut the window out afterwards
+			rawData, times = SortedTimes(self.Query(windowStart // 1000000000 - 1, -(-windowStop // 1000000000)))
+			window: slice = slice(int(numpy.searchsorted(times, windowStart, side="left")), int(numpy.searchsorted(times, windowStop, side="right")))
+			if window.stop <= window.start:
+				statistics.append(None)
+			else:
+				statistics.append(EDMetrics(rawData.iloc[window]).statistics)
+		return statistics
+
+	#Returns a source of the data of another stand. Only the source that this was called on needs to be closed
+	def ForStand(self, location: str, standID: str) -> "SensorDataSource":
+		return self
+
+	#Returns a description of where the data comes from, so that results calculated from it can be recognised later
+	def Fingerprint(self) -> dict:
+		return {"source" : type(self).__name__, "aggregationWindow" : self.aggregationWindow}
+
+	def Close(self) -> None:
+		pass
+
+
+#Queries InfluxDB, using a local cache of query results
+class InfluxSensorDataSource(SensorDataSource):
+	"""
+	Member variables:
+
+	char *url;
+	char *org;
+	char *bucket;
+	char *location;
+	char *standID;
+	int aggregationWindow;
+	InfluxCache influxCache;
+	influxdb_client.InfluxDBClient influxClient;
+	"""
+
+	INFLUXDB_URL: str = "https://gcpcb5eab166.customers.voltmetrix.io:8086"
+	INFLUXDB_BUCKET: str = "MZT_Process_Components"
+	INFLUXDB_LOCATION: str = "arches"
+	INFLUXDB_STAND_ID: str = "ED002"
+
+	def __init__(self, token: str, org: str, influxCache: InfluxCache, connections: int = 4, url: str = INFLUXDB_URL, bucket: str = INFLUXDB_BUCKET, location: str = INFLUXDB_LOCATION, standID: str = INFLUXDB_STAND_ID, aggregationWindow: int = 10) -> None:
+		self.url: str = url
+		self.org: str = org
+		self.bucket: str = bucket
+		self.location: str = location
+		self.standID: str = standID
+		self.aggregationWindow: int = aggregationWindow
+		self.influxCache: InfluxCache = influxCache
+
+		#One InfluxDB client is shared by all queries, with a connection pool large enough for every fetch thread
+		#influxdb_client is slow to import, so it's only imported by live runs
+		import influxdb_client
+		self.influxClient: influxdb_client.InfluxDBClient = influxdb_client.InfluxDBClient(url=self.url, token=token, org=self.org, connection_pool_maxsize=connections)
+
+
+	#Builds the Flux query for the data between two UNIX timestamps. If no channels are given, REQUIRED_CHANNELS are queried
+	def BuildFluxQuery(self, startTime: int, stopTime: int, channels: List[str] = None) -> str:
+		return f'\
+	{self.BuildFluxSource(str(startTime), str(stopTime), channels)}\
+	|> yield(name: "ED Data")'
+
+	#Builds the part of a Flux query that fetches, aggregates and pivots the data between two Flux times
+	#Only the given channels are read, and only the columns that make up the pivoted rows are kept, so that InfluxDB's bookkeeping columns aren't transferred
+	def BuildFluxSource(self, startTime: str, stopTime: str, channels: List[str] = None) -> str:
+		channelFilter: str = " or ".join(['(r["_field"] == "%s" and r["component_id"] == "%s")' % SplitChannel(channel) for channel in (channels or REQUIRED_CHANNELS)])
+		return f'\
+	from(bucket: "{self.bucket}")\
+	|> range(start: {startTime}, stop: {stopTime})\
+	|> filter(fn: (r) => r["_measurement"] == "component_value")\
+	|> filter(fn: (r) => r["location"] == "{self.location}")\
+	|> filter(fn: (r) => r["stand_id"] == "{self.standID}")\
+	|> filter(fn: (r) => {channelFilter})\
+	|> toFloat()\
+	|> aggregateWindow(every: {self.aggregationWindow}s, fn: mean, createEmpty: false)\
+	|> keep(columns: ["_time", "_value", "_field", "component_id"])\
+	|> pivot(rowKey:["_time"], columnKey: ["_field","component_id"], valueColumn: "_value")'
+
+	#Builds a Flux query that calculates WINDOW_STATISTICS on the server, returning one row per window with a "window" column holding its position in windows
+	#Each window is aggregated exactly as in BuildFluxQuery(), so its rows are those that Query() would return. Integrals use the trapezium rule, like EDMetrics.Integrate()
+	def BuildWindowStatisticsQuery(self, windows: List[Tuple[int, int]]) -> str:
+		#Aggregated rows are timestamped with the end of their aggregation window, so a window's first row covers the aggregation window before its start, and its last row the one before its stop
+		windowTables: List[str] = []
+		for n, (windowStart, windowStop) in enumerate(windows):
+			windowTables.append(f'{self.BuildFluxSource("time(v: %d)" % (windowStart - self.aggregationWindow * 1000000000), "time(v: %d)" % windowStop, None)}\
+	|> map(fn: (r) => ({{r with window: {n}}}))')
+
+		#As in EDMetrics.co2VolumeSeries, a missing CO2 reading or air flow counts as no CO2
+		query: str = f'\
+	data = union(tables: [{", ".join(windowTables)}])\
+	|> group(columns: ["window"])\
+	|> sort(columns: ["_time"])\
+	|> map(fn: (r) => ({{r with\
+		power: r.current_PSU001 * r.voltage_PSU001,\
+		co2Volume: if exists r.CO2_PPM_CO2001 and exists r.volumetric_flow_MFM001 then r.CO2_PPM_CO2001 / 1000000.0 * (r.volumetric_flow_MFM001 / 60.0) else 0.0,\
+		epoch: float(v: int(v: r._time)) / 1000000000.0\
+	}}))'
+
+		#Each statistic is reduced to one row per window, then they are all pivoted into one row per window
+		reductions: dict = {
+			"rows" : ("count", "epoch"),
+			"mean_current_PSU001" : ("mean", "current_PSU001"),
+			"std_current_PSU001" : ("stddev", "current_PSU001"),
+			"integral_current_PSU001" : ("integral", "current_PSU001"),
+			"mean_voltage_PSU001" : ("mean", "voltage_PSU001"),
+			"std_voltage_PSU001" : ("stddev", "voltage_PSU001"),
+			"std_power" : ("stddev", "power"),
+			"integral_power" : ("integral", "power"),
+			"std_co2Volume" : ("stddev", "co2Volume"),
+			"integral_co2Volume" : ("integral", "co2Volume"),
+			"first_pH_PH002" : ("first", "pH_PH002"),
+			"last_pH_PH002" : ("last", "pH_PH002"),
+			"first_epoch" : ("min", "epoch"),
+			"last_epoch" : ("max", "epoch")
+		}
+		statisticTables: List[str] = []
+		for statistic in WINDOW_STATISTICS:
+			function, column = reductions[statistic]
+			arguments: str = f'column: "{column}"'
+			if function == "integral":
+				arguments += ", unit: 1s"
+			statisticTables.append(f'data |> {function}({arguments}) |> map(fn: (r) => ({{window: r.window, statistic: "{statistic}", _value: float(v: r.{column})}}))')
+
+		return f'{query}\n\
+	union(tables: [{", ".join(statisticTables)}])\
+	|> group()\
+	|> pivot(rowKey: ["window"], columnKey: ["statistic"], valueColumn: "_value")\
+	|> yield(name: "ED window statistics")'
+
+
+	#Queries InfluxDB over the network, bypassing the cache
+	def QueryInfluxDB(self, startTime: int, stopTime: int) -> pd.DataFrame:
+		query_api = self.influxClient.query_api()
+		with PROFILER.Stage("influx_query") as stage:
+			rawData: pd.DataFrame = CompactSensorData(query_api.query_data_frame(org=self.org, query=self.BuildFluxQuery(startTime, stopTime)))
+			stage.AddRows(rawData.shape[0])
+		return rawData
+
+	def Query(self, startTime: int, stopTime: int) -> pd.DataFrame:
+		return CompactSensorData(self.influxCache.Fetch(self.bucket, self.standID, self.location, self.aggregationWindow, startTime, stopTime, self.QueryInfluxDB, REQUIRED_CHANNELS))
+
+	#Bypasses the cache, which only holds complete rows
+	def QueryChannels(self, startTime: int, stopTime: int, channels: List[str]) -> pd.DataFrame:
+		query_api = self.influxClient.query_api()
+		with PROFILER.Stage("influx_query") as stage:
+			rawData: pd.DataFrame = CompactSensorData(query_api.query_data_frame(org=self.org, query=self.BuildFluxQuery(startTime, stopTime, channels)))
+			stage.AddRows(rawData.shape[0])
+		return rawData
+
+	#All windows are aggregated in a single query, which returns one row per window
+	def QueryWindowStatistics(self, windows: List[Tuple[int, int]]) -> List[dict]:
+		if not windows:
+			return []
+		query_api = self.influxClient.query_api()
+		with PROFILER.Stage("influx_query") as stage:
+			result: pd.DataFrame = query_api.query_data_frame(org=self.org, query=self.BuildWindowStatisticsQuery(windows))
+			stage.AddRows(result.shape[0])
+		if isinstance(result, list):
+			result = pd.concat(result, ignore_index=True)
+
+		statistics: List[dict] = [None] * len(windows)
+		for row in result.to_dict("records"):
+			statistics[int(row["window"])] = {statistic : float(row.get(statistic, numpy.nan)) for statistic in WINDOW_STATISTICS}
+		return statistics
+
+	#Parses the response incrementally rather than buffering the whole of it. Bypasses the cache, as reading it would load the whole cache file
+	#Each table of the response is yielded as soon as it has been parsed. The pivot returns the rows as one table sorted by time, so the frames are in chronological order
+	def QueryStream(self, startTime: int, stopTime: int) -> Iterator[pd.DataFrame]:
+		query_api = self.influxClient.query_api()
+		for frame in query_api.query_data_frame_stream(org=self.org, query=self.BuildFluxQuery(startTime, stopTime)):
+			if not frame.empty:
+				yield CompactSensorData(frame).sort_values("_time", ignore_index=True)
+
+	#The source of another stand shares the InfluxDB client and the cache with this one
+	def ForStand(self, location: str, standID: str) -> "InfluxSensorDataSource":
+		if location == self.location and standID == self.standID:
+			return self
+		standSource: InfluxSensorDataSource = copy.copy(self)
+		standSource.location = location
+		standSource.standID = standID
+		return standSource
+
+	def Fingerprint(self) -> dict:
+		return dict(SensorDataSource.Fingerprint(self), url=self.url, bucket=self.bucket, location=self.location, standID=self.standID)
+
+	def Close(self) -> None:
+		self.influxClient.close()
+
+
+#Serves recorded sensor data from the .parquet and .csv files in a replay directory, with the same schema and time range semantics as InfluxDB
+#All recordings are loaded on the first query and kept in memory, sorted by time, so each query is a binary search
+#The top level recordings are the data of the default stand. Data from other stands is read from <location>/<stand ID> subdirectories, and a stand without one has no data
+class ReplaySensorDataSource(SensorDataSource):
+	"""
+	Member variables:
+
+	char *replayDirectory;
+	char *location;
+	char *standID;
+	pd.DataFrame recordedData;
+	threading.Lock lock;
+	"""
+
+	def __init__(self, replayDirectory: str, aggregationWindow: int = 10, location: str = InfluxSensorDataSource.INFLUXDB_LOCATION, standID: str = InfluxSensorDataSource.INFLUXDB_STAND_ID) -> None:
+		self.replayDirectory: str = replayDirectory
+		self.aggregationWindow: int = aggregationWindow
+		self.location: str = location
+		self.standID: str = standID
+		self.recordedData: pd.DataFrame = None
+		self.lock: threading.Lock = threading.Lock()
+
+	def LoadRecordings(self) -> pd.DataFrame:
+		with self.lock:
+			if self.recordedData is None:
+				frames: List[pd.DataFrame] = []
+				for filename in sorted(glob.glob(os.path.join(self.replayDirectory, "*.parquet")) + glob.glob(os.path.join(self.replayDirectory, "*.csv"))):
+					if os.path.splitext(os.path.basename(filename))[0] == DASHBOARD_BASENAME:
+						continue
+					if filename.endswith(".parquet"):
+						frame: pd.DataFrame = pd.read_parquet(filename)
+					else:
+						frame = pd.read_csv(filename)
+					frames.append(CompactSensorData(frame))
+
+				if frames:
+					#Recordings may overlap, so keep one row per timestamp
+					self.recordedData = pd.concat(frames, ignore_index=True).drop_duplicates(subset="_time", keep="first").sort_values("_time", ignore_index=True)
+				else:
+					self.recordedData = pd.DataFrame({"_time" : pd.Series([], dtype="datetime64[ns, UTC]")})
+			return self.recordedData
+
+	def ForStand(self, location: str, standID: str) -> "ReplaySensorDataSource":
+		if location == self.location and standID == self.standID:
+			return self
+		#Falling back to the default stand's recordings would give plausible but wrong metrics, so a stand without recordings has no data
+		standDirectory: str = os.path.join(self.replayDirectory, location, standID)
+		if not os.path.isdir(standDirectory):
+			print ("Warning: no recordings of stand %s at %s were found in %s, so its experiments have no data" % (standID, location, standDirectory), file=sys.stderr)
+		return ReplaySensorDataSource(standDirectory, self.aggregationWindow, location, standID)
+
+	def Fingerprint(self) -> dict:
+		return dict(SensorDataSource.Fingerprint(self), replayDirectory=os.path.abspath(self.replayDirectory))
+
+	def Query(self, startTime: int, stopTime: int) -> pd.DataFrame:
+		recordedData: pd.DataFrame = self.LoadRecordings()
+		times: pd.Series = recordedData["_time"]
+		first: int = int(times.searchsorted(pd.Timestamp(startTime, unit="s", tz="UTC"), side="right"))
+		last: int = int(times.searchsorted(pd.Timestamp(stopTime, unit="s", tz="UTC"), side="right"))
+		return recordedData.iloc[first:last].reset_index(drop=True)
+
+
+#Passes sensor data through from another source, saving a copy of every query result into a replay directory
+#Data from stands other than the source's own is saved into <location>/<stand ID> subdirectories
+class RecordingSensorDataSource(SensorDataSource):
+	"""
+	Member variables:
+
+	SensorDataSource source;
+	char *recordDirectory;
+	"""
+
+	def __init__(self, source: SensorDataSource, recordDirectory: str) -> None:
+		self.source: SensorDataSource = source
+		self.aggregationWindow: int = source.aggregationWindow
+		self.recordDirectory: str = recordDirectory
+		os.makedirs(self.recordDirectory, exist_ok=True)
+
+	#A streamed query is recorded as one file per frame, numbered by part
+	def Record(self, startTime: int, stopTime: int, data: pd.DataFrame, part: int = 0) -> pd.DataFrame:
+		if not data.empty:
+			filename: str = "sensor_%d_%d.parquet" % (startTime, stopTime) if part == 0 else "sensor_%d_%d_%d.parquet" % (startTime, stopTime, part)
+			data.to_parquet(os.path.join(self.recordDirectory, filename), index=False)
+		return data
+
+	#QueryChannels() and QueryWindowStatistics() are not passed through, so that complete rows are recorded even when the source could aggregate on the server
+	def Query(self, startTime: int, stopTime: int) -> pd.DataFrame:
+		return self.Record(startTime, stopTime, self.source.Query(startTime, stopTime))
+
+	def QueryStream(self, startTime: int, stopTime: int) -> Iterator[pd.DataFrame]:
+		for part, frame in enumerate(self.source.QueryStream(startTime, stopTime)):
+			yield self.Record(startTime, stopTime, frame, part)
+
+	def ForStand(self, location: str, standID: str) -> "RecordingSensorDataSource":
+		standSource: SensorDataSource = self.source.ForStand(location, standID)
+		if standSource is self.source:
+			return self
+		return RecordingSensorDataSource(standSource, os.path.join(self.recordDirectory, location, standID))
+
+	def Fingerprint(self) -> dict:
+		return self.source.Fingerprint()
+
+	def Close(self) -> None:
+		self.source.Close()
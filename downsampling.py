@@ -0,0 +1,73 @@
+from typing import List
+import numpy
+import pandas as pd
+
+#Shape-preserving downsampling of sensor traces for the time series figures of the report
+#Uses Largest-Triangle-Three-Buckets (Steinarsson, 2013), which keeps the peaks and steps of a trace rather than averaging them away
+
+#Channels drawn in the time series figures, in order from top to bottom
+TRACE_CHANNELS: List[str] = ["current_PSU001", "voltage_PSU001", "CO2_PPM_CO2001", "pH_PH002"]
+
+
+#Returns the indices of at most maxPoints points of (x, y) chosen by LTTB, in ascending order. The first and last points are always kept
+#x must be sorted and neither x nor y may contain NaN
+def LTTB(x: numpy.ndarray, y: numpy.ndarray, maxPoints: int) -> numpy.ndarray:
+	length: int = x.size
+	if maxPoints >= length or maxPoints < 3:
+		return numpy.arange(0, length)
+
+	#Every point apart from the first and last is put into one of maxPoints - 2 buckets of (almost) equal size
+	bucketEdges: numpy.ndarray = (numpy.arange(0, maxPoints - 1) * ((length - 2) / (maxPoints - 2))).astype(numpy.int64) + 1
+	bucketEdges[-1] = length - 1
+	bucketSizes: numpy.ndarray = numpy.diff(bucketEdges)
+	#The average point of each bucket, and of the last point, which stands in as the bucket after the last one
+	averageX: numpy.ndarray = numpy.append(numpy.add.reduceat(x[:length - 1], bucketEdges[:-1]) / bucketSizes, x[length - 1])
+	averageY: numpy.ndarray = numpy.append(numpy.add.reduceat(y[:length - 1], bucketEdges[:-1]) / bucketSizes, y[length - 1])
+
+	indices: numpy.ndarray = numpy.empty(maxPoints, dtype=numpy.int64)
+	indices[0] = 0
+	indices[maxPoints - 1] = length - 1
+	previous: int = 0
+	for n in range(0, maxPoints - 2):
+		#Pick the point of the bucket that forms the largest triangle with the previously picked point and the average of the next bucket
+		bucketX: numpy.ndarray = x[bucketEdges[n]:bucketEdges[n + 1]]
+		bucketY: numpy.ndarray = y[bucketEdges[n]:bucketEdges[n + 1]]
+		areas: numpy.ndarray = numpy.abs((x[previous] - averageX[n + 1]) * (bucketY - y[previous]) - (x[previous] - bucketX) * (averageY[n + 1] - y[previous]))
+		previous = bucketEdges[n] + int(numpy.argmax(areas))
+		indices[n + 1] = previous
+	return indices
+
+
+#Downsamples each channel in TRACE_CHANNELS of a frame of sensor data to at most maxPoints points, dropping missing readings
+#Returns a long frame with "_time", "channel" and "value" columns, which is far smaller than the rows it was made from
+def DownsampleTraces(rawData: pd.DataFrame, maxPoints: int) -> pd.DataFrame:
+	frames: List[pd.DataFrame] = []
+	if not rawData.empty:
+		times: numpy.ndarray = pd.DatetimeIndex(rawData["_time"]).as_unit("ns").asi8
+		order: numpy.ndarray = numpy.argsort(times, kind="stable")
+		for channel in TRACE_CHANNELS:
+			if channel not in rawData.columns:
+				continue
+			values: numpy.ndarray = rawData[channel].to_numpy(dtype=numpy.float64)[order]
+			valid: numpy.ndarray = ~numpy.isnan(values)
+			channelTimes: numpy.ndarray = times[order][valid]
+			values = values[valid]
+			#Times are measured in seconds from the first point, so that the areas of the triangles don't lose precision in float64
+			indices: numpy.ndarray = LTTB((channelTimes - channelTimes[0]) / 1e9 if channelTimes.size else channelTimes.astype(numpy.float64), values, maxPoints)
+			frames.append(pd.DataFrame({
+				"_time" : pd.to_datetime(channelTimes[indices], unit="ns", utc=True),
+				"channel" : channel,
+				"value" : values[indices].astype(numpy.float32)
+			}))
+	if not frames:
+		return pd.DataFrame({"_time" : pd.Series([], dtype="datetime64[ns, UTC]"), "channel" : pd.Series([], dtype=str), "value" : pd.Series([], dtype=numpy.float32)})
+	return pd.concat(frames, ignore_index=True)
+
+
+#Merges the traces of a new chunk of data into those already downsampled, keeping at most maxPoints points per channel
+#Used when an experiment arrives in chunks, so that the traces never hold more than about twice maxPoints points per channel
+def MergeTraces(traces: pd.DataFrame, newTraces: pd.DataFrame, maxPoints: int) -> pd.DataFrame:
+	if traces is None or traces.empty:
+		return newTraces
+	merged: pd.DataFrame = pd.concat([traces, newTraces], ignore_index=True)
+	return DownsampleTraces(merged.pivot_table(index="_time", columns="channel", values="value", aggfunc="first").reset_index(), maxPoints)
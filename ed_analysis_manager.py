@@ -1,24 +1,35 @@
 #Import pip packages
-from typing import Type, List
-import requests, json
+from typing import Type, List, Iterator, Tuple
 import numpy
 import pandas as pd
 import os
 import time
 import math
 from datetime import datetime, timedelta
-import influxdb_client
-from influxdb_client import InfluxDBClient, Point, WritePrecision
-from influxdb_client.client.write_api import SYNCHRONOUS
-import notion_df
 import sys
 from dotenv import load_dotenv
-import plotly.express as px
-import argparse
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 #Import project files
 from experiment_meta import ExperimentMeta
-from ed_metric_calculations import EDMetrics
+from ed_metric_calculations import EDMetrics, StackStatistics, CHANNEL_DTYPES
+from uncertain_array import UncertainArray
+from step_detection import DetectSteps, IncrementalStepDetector, ENDPOINT_OFFSET, DEFAULT_ROLL, DEFAULT_PERCENT_TOLERANCE
+from influx_cache import InfluxCache
+from notion_snapshot import NotionSnapshot
+from experiment_catalog import ExperimentCatalog
+from data_sources import MetadataSource, NotionMetadataSource, ReplayMetadataSource, RecordingMetadataSource, SensorDataSource, InfluxSensorDataSource, ReplaySensorDataSource, RecordingSensorDataSource
+from metrics_store import MetricsStore
+from results_store import ResultsStore
+from report_writer import ReportWriter
+from window_index import SortedTimes, WindowSlices, WindowTimeRanges, WINDOW_LENGTH
+from time_conversion import ToEpochSeconds
+from profiling import PROFILER
+from shared_frames import SharedFrame
+from query_planner import QueryBatch, PlanQueries
+from downsampling import DownsampleTraces, MergeTraces
 
 #Class with functionality that covers database queries, data processing and plotting graphs
 class EDAnalysisManager(object):
@@ -26,35 +37,255 @@ class EDAnalysisManager(object):
 	Member variables:
 
 	pd.DataFrame notionDashboard;
+	ExperimentCatalog catalog;
+	dict selectors;
 	ExperimentMeta *Experiments;
+	MetadataSource metadataSource;
+	SensorDataSource sensorSource;
+	dict standSources;
+	char *location;
+	char *standID;
+	ResultsStore resultsStore;
+	dict queryBatches;
+	int jobs;
+	int processes;
+	bool stream;
+	int memoryBudget;
+	bool pushdown;
+	bool timeseries;
+	int maxPoints;
+	Tuple *reports;
 	"""
 
-	def __init__(self, config: dict) -> None:
-		#Load local env variables into RAM
+	#With reports (see config_manager.LoadJobFile()), the experiments of every report are processed together, and WriteReports() writes each report
+	def __init__(self, config: dict, reports: List[dict] = None) -> None:
+		#Set defaults and override using the passed config
+		self.SetUpReport(config)
+
+		self.exclude: bool = config["exclude"]
+
+		#Number of experiments fetched concurrently
+		self.jobs: int = 4
+		if config["jobs"]:
+			self.jobs = max(1, int(config["jobs"]))
+
+		#Number of worker processes that step detection and metrics are calculated in. 0 calculates them in this process
+		self.processes: int = 0
+		if config["processes"]:
+			self.processes = max(0, int(config["processes"]))
+
+		#Streaming mode bounds memory use by the budget (in MB) rather than the length of the experiment
+		self.stream: bool = bool(config["stream"])
+		memoryBudget: float = 256.0 #MB
+		if config["memory_budget"]:
+			memoryBudget = float(config["memory_budget"])
+		self.memoryBudget: int = int(memoryBudget * 1024 * 1024)
+
+		#Experiments on the same stand that overlap or are within batchGap seconds of each other are fetched in one query of at most batchSpan seconds and batchRows rows
+		self.batchGap: float = 600.0
+		if config["batch_gap"]:
+			self.batchGap = float(config["batch_gap"])
+		self.batchSpan: float = 24.0 * 3600.0
+		if config["batch_span"]:
+			self.batchSpan = float(config["batch_span"]) * 3600.0
+		self.batchRows: int = 20000
+		if config["batch_rows"]:
+			self.batchRows = int(config["batch_rows"])
+		self.queryBatches: dict = {}
+
+		#Experiment followed by --watch, and how often in seconds it is polled for new data
+		self.watchID: str = config["watch"]
+		self.pollInterval: float = 10.0
+		if config["poll_interval"]:
+			self.pollInterval = float(config["poll_interval"])
+
+		#Pushdown mode has the data source calculate the window statistics, so only the current and a few rows per window are transferred
+		self.pushdown: bool = bool(config["pushdown"])
+
+		#Stand and location of experiments that don't specify them in the dashboard
+		self.location: str = InfluxSensorDataSource.INFLUXDB_LOCATION
+		if config["location"]:
+			self.location = config["location"]
+		self.standID: str = InfluxSensorDataSource.INFLUXDB_STAND_ID
+		if config["stand"]:
+			self.standID = config["stand"]
+
+		#Whether the report includes the sensor traces of each experiment, downsampled to at most maxPoints points per channel
+		self.timeseries: bool = bool(config["timeseries"])
+		self.maxPoints: int = 2000
+		if config["max_points"]:
+			self.maxPoints = max(3, int(config["max_points"]))
+
+		#Experiments are only selected if they match these, see ParseSelectors()
+		self.selectors: dict = self.ParseSelectors(config)
+
+		#Set up the sources of experiment metadata and sensor data, and the store of previously processed results
+		self.SetUpDataSources(config)
+		self.SetUpResultsStore(config)
+
+		#Request experiment metadata from the dashboard, unless the catalog of experiments is up to date
+		self.SyncCatalog(config)
+		self.Experiments: List[ExperimentMeta]= [] # Initialize list containing metadata for all experiments
+		self.reports: List[Tuple[dict, List[ExperimentMeta]]] = []
+		if reports:
+			if self.watchID:
+				print ("Error: --watch can't be used with --job-file", file=sys.stderr)
+				sys.exit(1)
+			self.ParseReports(reports)
+		else:
+			self.ParseExperimentMetadata(config["experimentIDs"])
+		self.catalog.Close()
+		self.SetUpStandSources()
+
+		#Loop through Experiments list, request sensor data and process it
 		try:
-			self.LoadEnvironmentVariables()
-		except Exception as e:
-			print (e, file=sys.stderr)
-			sys.exit(1)
+			if self.watchID:
+				self.Watch(self.pollInterval)
+			else:
+				self.ProcessData()
+		finally:
+			self.sensorSource.Close()
 
-		#Set defaults and override using the passed config
+
+	#Reads the options that only affect how the report is written, which can differ between the reports of a job file
+	def SetUpReport(self, config: dict) -> None:
 		self.outputFilename: str = "out.html"
 		if config["output"]:
 			self.outputFilename = config["output"]
 
-		if config["dashboard"]:
-			self.NOTION_DATABASE_ID = config["dashboard"]#this variable was already declared inside of the self.LoadEnvironmentVariables() function
+		#File that the processed data table is exported to, if any
+		self.metricsOutFilename: str = config["metrics_out"]
 
-		self.exclude: bool = config["exclude"]
+		#How plotly.js is included in the report, and whether figures are rendered in parallel
+		self.plotlyJS: str = "inline"
+		if config["plotlyjs"]:
+			self.plotlyJS = config["plotlyjs"]
+		self.parallelRender: bool = bool(config["parallel_render"])
 
+		#Whether the report's figures are split into one panel per stand
+		self.facetByStand: bool = bool(config["facet_by_stand"])
 
-		#Request experiment metadata from Notion API
-		self.FetchExperimentDataFromNotion()
-		self.Experiments: List[ExperimentMeta]= [] # Initialize list containing metadata for all experiments
-		self.ParseExperimentMetadata(config["experimentIDs"])
 
-		#Loop through Experiments list, request data from InfluxDB and process data
-		self.ProcessData()
+	#Creates the metadata and sensor data sources. Secrets are only needed when data comes from Notion and InfluxDB
+	def SetUpDataSources(self, config: dict) -> None:
+		if config["source"] == "replay":
+			if not config["replay_dir"]:
+				print ("Error: --replay-dir must be given when replaying recorded data", file=sys.stderr)
+				sys.exit(1)
+			self.metadataSource: MetadataSource = ReplayMetadataSource(config["replay_dir"])
+			self.sensorSource: SensorDataSource = ReplaySensorDataSource(config["replay_dir"], location=self.location, standID=self.standID)
+		else:
+			#Load local env variables into RAM
+			try:
+				self.LoadEnvironmentVariables()
+			except Exception as e:
+				print (e, file=sys.stderr)
+				sys.exit(1)
+
+			if config["dashboard"]:
+				self.NOTION_DATABASE_ID = config["dashboard"]#this variable was already declared inside of the self.LoadEnvironmentVariables() function
+
+			#Set up the local caches of InfluxDB query results and the Notion dashboard
+			cacheDirectory: str = ".ed_cache"
+			if config["cache_dir"]:
+				cacheDirectory = config["cache_dir"]
+			cacheSize: float = 1024.0 #MB
+			if config["cache_size"]:
+				cacheSize = float(config["cache_size"])
+			influxCache: InfluxCache = InfluxCache(cacheDirectory, int(cacheSize * 1024 * 1024), bool(config["refresh"]))
+
+			notionTTL: float = 300.0 #s
+			if config["notion_ttl"]:
+				notionTTL = float(config["notion_ttl"])
+			notionSnapshot: NotionSnapshot = NotionSnapshot(self.NOTION_DATABASE_ID, self.NOTION_API_KEY, cacheDirectory, notionTTL, bool(config["refresh"]))
+
+			self.metadataSource = NotionMetadataSource(notionSnapshot)
+			self.sensorSource = InfluxSensorDataSource(self.INFLUXDB_API_KEY, self.INFLUXDB_ORG, influxCache, self.jobs, location=self.location, standID=self.standID)
+
+		#Save a copy of everything that is fetched, so that this run can be replayed later
+		if config["record"]:
+			self.metadataSource = RecordingMetadataSource(self.metadataSource, config["record"])
+			self.sensorSource = RecordingSensorDataSource(self.sensorSource, config["record"])
+
+
+	#Creates a sensor data source for each stand that the experiments were run on. Experiments on different stands are fetched concurrently by the same pool of threads
+	def SetUpStandSources(self) -> None:
+		self.standSources: dict = {}
+		for exp in self.Experiments:
+			if (exp.location, exp.standID) not in self.standSources:
+				self.standSources[(exp.location, exp.standID)] = self.sensorSource.ForStand(exp.location, exp.standID)
+
+	#Returns the sensor data source of the stand that an experiment was run on
+	def SensorSource(self, exp: ExperimentMeta) -> SensorDataSource:
+		return self.standSources[(exp.location, exp.standID)]
+
+
+	#Results are stored in the cache directory by default. Replayed data can change between runs, so with --source replay they are only stored if --results-dir is given
+	def SetUpResultsStore(self, config: dict) -> None:
+		self.resultsStore: ResultsStore = None
+		resultsDirectory: str = config["results_dir"]
+		if not resultsDirectory:
+			if config["source"] == "replay":
+				return
+			resultsDirectory = os.path.join(config["cache_dir"] or ".ed_cache", "results")
+		#A recording needs the sensor data of every experiment, so stored results aren't reused while recording, though they are still updated
+		self.resultsStore = ResultsStore(resultsDirectory, self.AnalysisParameters(), bool(config["refresh"] or config["record"]))
+
+
+	#Reads the --since, --until, --match and --on-stand selectors, which restrict the experiments to those started in [since, until), with labels matching a glob pattern, on a stand
+	#Dates are read like the dashboard's, so times without a time zone are in local time
+	@staticmethod
+	def ParseSelectors(config: dict) -> dict:
+		selectors: dict = {"since" : None, "until" : None, "pattern" : config["match"], "stand" : config["on_stand"]}
+		for key in ("since", "until"):
+			if config[key]:
+				try:
+					selectors[key] = float(ToEpochSeconds([config[key]])[0])
+				except (ValueError, TypeError):
+					raise Exception("Error: --%s must be a date, e.g. 2024-07-01, or a date and time, e.g. \"2024-07-01 09:30\"" % key)
+		return selectors
+
+	#Returns whether any experiments are excluded by the selectors
+	@staticmethod
+	def HasSelectors(selectors: dict) -> bool:
+		return any(value is not None and value != "" for value in selectors.values())
+
+	#Experiments are selected from a local catalog, which is stored in the cache directory and rebuilt whenever the dashboard is loaded
+	#The dashboard is only loaded if the catalog is older than the Notion TTL, or the run needs it: to watch an experiment, to record it, or when replaying (where the catalog is only kept in memory)
+	def SyncCatalog(self, config: dict) -> None:
+		self.notionDashboard: pd.DataFrame = None
+		if config["source"] == "replay":
+			self.catalog: ExperimentCatalog = ExperimentCatalog()
+			catalogSource: str = os.path.abspath(config["replay_dir"])
+			catalogTTL: float = 0.0
+		else:
+			cacheDirectory: str = config["cache_dir"] or ".ed_cache"
+			os.makedirs(cacheDirectory, exist_ok=True)
+			self.catalog = ExperimentCatalog(os.path.join(cacheDirectory, "catalog.sqlite"))
+			catalogSource = self.NOTION_DATABASE_ID
+			catalogTTL = 300.0 #s
+			if config["notion_ttl"]:
+				catalogTTL = float(config["notion_ttl"])
+
+		if self.watchID or config["record"] or config["refresh"] or self.catalog.Age(catalogSource) > catalogTTL:
+			self.FetchDashboard()
+			with PROFILER.Stage("catalog") as stage:
+				self.catalog.Update(self.notionDashboard, catalogSource)
+				stage.AddRows(self.notionDashboard.shape[0])
+
+	#Everything apart from the sensor data that the processed metrics depend on
+	def AnalysisParameters(self) -> dict:
+		return {
+			"sensorSource" : self.sensorSource.Fingerprint(),
+			"edMetrics" : EDMetrics.Constants(),
+			#The dtypes that sensor data is stored in change the metrics slightly
+			"channelDTypes" : {channel : numpy.dtype(dtype).name for channel, dtype in CHANNEL_DTYPES.items()},
+			"roll" : DEFAULT_ROLL,
+			"percentTolerance" : DEFAULT_PERCENT_TOLERANCE,
+			"endpointOffset" : ENDPOINT_OFFSET,
+			"windowLength" : WINDOW_LENGTH.total_seconds(),
+			"pushdown" : self.pushdown
+		}
 
 
 	#Reads .env file in local directory and saves env variables as member variables
@@ -71,327 +302,518 @@ class EDAnalysisManager(object):
 
 
 #Queries Notion and loads dashboard as pandas DataFrame
-	def FetchExperimentDataFromNotion(self) -> None:
+	#With Notion, a local snapshot of the dashboard is used, and only pages edited since the last sync are downloaded
+	def FetchDashboard(self) -> None:
 		try:
-			self.notionDashboard: pd.DataFrame = notion_df.download(self.NOTION_DATABASE_ID, api_key=self.NOTION_API_KEY)
-		except:
-			print ("There was an error communicating with the Notion API", file=sys.stderr)
+			with PROFILER.Stage("dashboard") as stage:
+				self.notionDashboard: pd.DataFrame = self.metadataSource.Load()
+				stage.AddRows(self.notionDashboard.shape[0])
+		except Exception as e:
+			print ("There was an error loading the experiment dashboard: %s" % e, file=sys.stderr)
 			sys.exit(1)
 
 
-	# Implementation of a merge sort algorithm
-	@staticmethod
-	def MergeSort(ip: list) -> list:
-		# Divide the array into 2
-		# Recursively call this function on them
-		# Merge the two arrays, assuming they are themselves sorted
-
-		# Define recursion endpoint condition
-		ipLen: int = len(ip)
-		if ipLen <= 1:
-			return ip
-
-		# Split the lists in half
-		midpoint: int = int(len(ip) / 2.0)
-		leftList: list = ip[0 : midpoint]
-		rightList: list = ip[midpoint : len(ip)]
-
-		#print (f"{leftList}\n{rightList}\n")
-
-		# Recursively sort the list fragments
-		leftList = EDAnalysisManager.MergeSort(leftList)
-		rightList = EDAnalysisManager.MergeSort(rightList)
-
-		# Merge the two sorted lists
-		# Initialise variables for loop
-		leftIndex: int = 0
-		rightIndex: int = 0
-		leftLen: int = len(leftList)
-		rightLen: int = len(rightList)
-		op: list = []
-
-		while leftIndex + rightIndex < leftLen + rightLen:
-			if (leftIndex < leftLen and rightIndex < rightLen):
-				if leftList[leftIndex] <= rightList[rightIndex]:
-					op.append(leftList[leftIndex])
-					leftIndex += 1
-				else:
-					op.append(rightList[rightIndex])
-					rightIndex += 1
-			elif rightIndex >= rightLen:
-				op.append(leftList[leftIndex])
-				leftIndex += 1
-			elif leftIndex >= leftLen:
-				op.append(rightList[rightIndex])
-				rightIndex += 1
-
-
-		return op
-
-
 #Takes experiment IDs and gets start and end timestamps from Notion database
 	def ParseExperimentMetadata(self, experimentIDs: List[str]) -> None:
-		#Iterate through command line arguments, match them with experiment IDs in the notion database, use the DataFrame row to initialise and ExperimentMeta object and append to self.Experiments
+		#A watched experiment is usually still running, so it may not be marked as completed or have an end time yet
+		if self.watchID:
+			watchedRows: pd.DataFrame = self.notionDashboard[self.notionDashboard["Experimental Name"] == self.watchID].head(1)
+			self.Experiments.extend(ExperimentMeta.FromDashboard(watchedRows, self.location, self.standID, openEnded=True))
+			if not self.Experiments:
+				print ("Error: No experiment with ID \"%s\" and a start time was found" % self.watchID, file=sys.stderr)
+				sys.exit(1)
+			return
+
+		#Match the command line arguments with experiment IDs in the catalog of the notion database, use them to initialise ExperimentMeta objects and append them to self.Experiments
 		if experimentIDs and not self.exclude:
-			for n in range (0, len(experimentIDs)):
-				experimentID = experimentIDs[n]
-				dashboardRow: pd.DataFrame = self.notionDashboard[self.notionDashboard["Experimental Name"] == experimentID]
-				if dashboardRow.empty:
-					print ("Warning: No experiment with ID \"%s\" was found" % (experimentID), file=sys.stderr)
-				else:
-					self.Experiments.append(ExperimentMeta(dashboardRow.iloc[0]))
+			#If an ID appears more than once, the first row is used. Experiments appear in the order that they are given
+			with PROFILER.Stage("select") as stage:
+				experiments, missingIDs = self.catalog.SelectIDs(experimentIDs, self.location, self.standID, **self.selectors)
+				stage.AddRows(len(experiments))
+			for experimentID in missingIDs:
+				print ("Warning: No experiment with ID \"%s\" was found" % (experimentID), file=sys.stderr)
+			self.Experiments.extend(experiments)
 
 		#If no command arguments are passed, default to adding all experiments with the "Completed" field ticked
 		else:
-			#Filter irrelevant columns out of the dashboard
-			relevantDashboard: pd.DataFrame = self.notionDashboard[self.notionDashboard["Completed"]]
-			if relevantDashboard.empty:
-				print ("Error: No experiment IDs were passed, and no completed experiments were found in the Notion dashboard", file=sys.stderr)
-				sys.exit(1)
-			for index, row in relevantDashboard.iterrows():
-				if (not self.exclude) or (not (row.loc["Experimental Name"] in experimentIDs)):
-					self.Experiments.append(ExperimentMeta(row))
+			if self.catalog.CountCompleted() == 0:
+				raise Exception("Error: No experiment IDs were passed, and no completed experiments were found in the Notion dashboard")
+			with PROFILER.Stage("select") as stage:
+				experiments = self.catalog.SelectCompleted(self.location, self.standID, experimentIDs if self.exclude else [], **self.selectors)
+				stage.AddRows(len(experiments))
+			if not experiments and self.HasSelectors(self.selectors):
+				raise Exception("Error: No completed experiments match --since, --until, --match and --on-stand")
+			self.Experiments.extend(experiments)
 
 			# Sort experiments in chronological order
-			self.Experiments = self.MergeSort(self.Experiments)
+			self.Experiments.sort(key=lambda exp: exp.startTime)
+
+
+	#Selects the experiments of each report of a job file from the catalog
+	#An experiment that is in several reports is only fetched and processed once, and its results are shared by all of them
+	#A report whose experiments can't be selected is skipped, without stopping the others, and counted as failed by WriteReports()
+	def ParseReports(self, reports: List[dict]) -> None:
+		sharedExperiments: dict = {}
+		for report in reports:
+			self.Experiments = []
+			self.exclude = bool(report["exclude"])
+			try:
+				self.selectors = self.ParseSelectors(report)
+				self.ParseExperimentMetadata(report["experimentIDs"])
+			except Exception as e:
+				print ("Report %s will be skipped. %s" % (report["output"], e), file=sys.stderr)
+				self.reports.append((report, None))
+				continue
+			experiments: List[ExperimentMeta] = [sharedExperiments.setdefault((exp.experimentID, exp.label, exp.startTime, exp.stopTime, exp.location, exp.standID), exp) for exp in self.Experiments]
+			self.reports.append((report, experiments))
+		self.Experiments = list(sharedExperiments.values())
+
+
+	#Dependency for ProcessData(). Takes timestamps from ExperimentMeta object, and returns a pandas DataFrame with the raw experimental data from the sensor data source
+	def FetchRawData(self, experimentMeta: ExperimentMeta) -> pd.DataFrame:
+		#Query only allows integral timestamps
+		START_TIME: int = int(experimentMeta.startTime)
+		STOP_TIME: int = int(experimentMeta.stopTime)
 
+		with PROFILER.Stage("fetch", experimentMeta.label) as stage:
+			if experimentMeta in self.queryBatches:
+				rawData: pd.DataFrame = self.queryBatches[experimentMeta].Slice(experimentMeta, self.SensorSource(experimentMeta))
+			else:
+				rawData = self.SensorSource(experimentMeta).Query(START_TIME, STOP_TIME)
+			stage.AddRows(rawData.shape[0])
+			stage.AddBytes(int(rawData.memory_usage(deep=True).sum()))
 
+		if self.timeseries:
+			self.DownsampleTraces(experimentMeta, rawData)
+		return rawData
 
+	#Keeps the downsampled sensor traces of an experiment for the time series figures
+	def DownsampleTraces(self, experimentMeta: ExperimentMeta, rawData: pd.DataFrame) -> None:
+		with PROFILER.Stage("downsampling", experimentMeta.label) as stage:
+			experimentMeta.traces = DownsampleTraces(rawData, self.maxPoints)
+			stage.AddRows(experimentMeta.traces.shape[0])
 
-	#Dependency for ProcessData(). Takes timestamps from ExperimentMeta object, queries InfluxDB and returns a pandas DataFrame with the raw experimental data
-	def FetchFromInfluxDB(self, experimentMeta: ExperimentMeta) -> pd.DataFrame:
-		#Setup InfluxDB client
-		url: str = "https://gcpcb5eab166.customers.voltmetrix.io:8086"
-		client: influxdb_client.InfluxDBClient = influxdb_client.InfluxDBClient(url=url, token=self.INFLUXDB_API_KEY, org=self.INFLUXDB_ORG)
-		
-		#Query only allows integral timestamps
+
+	#Dependency for ProcessData() in streaming mode. Yields the raw experimental data in consecutive time chunks
+	#The length of each chunk is chosen so that it fits in the memory budget, based on the size of the rows received so far
+	def StreamRawData(self, experimentMeta: ExperimentMeta) -> Iterator[pd.DataFrame]:
 		START_TIME: int = int(experimentMeta.startTime)
 		STOP_TIME: int = int(experimentMeta.stopTime)
+		sensorSource: SensorDataSource = self.SensorSource(experimentMeta)
+
+		#Pessimistic guess until the first chunk arrives. Parsing and pivoting the response takes several times the memory of the resulting frame
+		bytesPerRow: float = 64 * 8.0
+		PARSING_OVERHEAD: float = 4.0
+
+		chunkStart: int = START_TIME
+		while chunkStart < STOP_TIME:
+			rowsPerChunk: int = max(int(self.memoryBudget / (bytesPerRow * PARSING_OVERHEAD)), 1)
+			#Chunk boundaries are aligned to the aggregation window, so that the rows are the same as those of a single query
+			chunkStop: int = (chunkStart + rowsPerChunk * sensorSource.aggregationWindow) // sensorSource.aggregationWindow * sensorSource.aggregationWindow
+			chunkStop = min(max(chunkStop, chunkStart + 1), STOP_TIME)
+
+			#Each frame of the response is passed on as soon as it arrives, rather than after the whole chunk has been fetched
+			frames: Iterator[pd.DataFrame] = sensorSource.QueryStream(chunkStart, chunkStop)
+			while True:
+				with PROFILER.Stage("fetch", experimentMeta.label) as stage:
+					frame: pd.DataFrame = next(frames, None)
+					if frame is not None:
+						stage.AddRows(frame.shape[0])
+						stage.AddBytes(int(frame.memory_usage(deep=True).sum()))
+				if frame is None:
+					break
+				if not frame.empty:
+					bytesPerRow = max(bytesPerRow, frame.memory_usage(deep=True).sum() / len(frame))
+					yield frame
+			chunkStart = chunkStop
+
+
+	#Dependency for ProcessData() in pushdown mode. Fetches only the current to detect the steps, then has the sensor data source calculate the statistics of each window
+	#Returns the statistics of each window, or None for windows without data
+	def FetchWindowStatistics(self, experimentMeta: ExperimentMeta) -> List[dict]:
+		START_TIME: int = int(experimentMeta.startTime)
+		STOP_TIME: int = int(experimentMeta.stopTime)
+
+		with PROFILER.Stage("fetch", experimentMeta.label) as stage:
+			currentData: pd.DataFrame = self.SensorSource(experimentMeta).QueryChannels(START_TIME, STOP_TIME, ["current_PSU001"])
+			stage.AddRows(currentData.shape[0])
+			stage.AddBytes(int(currentData.memory_usage(deep=True).sum()))
+		if currentData.empty:
+			print ("Warning: no data was found for experiment labelled \"%s\"" % experimentMeta.label, file=sys.stderr)
+			return []
+		#Only the current is downloaded, so it is the only trace that can be drawn
+		if self.timeseries:
+			self.DownsampleTraces(experimentMeta, currentData)
+
+		#Steps are detected on the sorted rows, so that the slice indices refer to the same rows as the timestamps
+		currentData, times = SortedTimes(currentData)
+		with PROFILER.Stage("step_detection", experimentMeta.label) as stage:
+			sliceIndices: List[int] = DetectSteps(currentData["current_PSU001"])
+			stage.AddRows(currentData.shape[0])
+
+		with PROFILER.Stage("window_statistics", experimentMeta.label) as stage:
+			statistics: List[dict] = self.SensorSource(experimentMeta).QueryWindowStatistics(WindowTimeRanges(times, sliceIndices))
+			stage.AddRows(len(statistics))
+		return statistics
+
+
+	#Streaming version of AnalyseExperiment(). Only the current chunk plus enough preceding rows to cover a 5 minute window are held in memory
+	def AnalyseExperimentStreaming(self, exp: ExperimentMeta) -> None:
+		analysis: IncrementalAnalysis = IncrementalAnalysis(exp, self.maxPoints if self.timeseries else 0)
+		for chunk in self.StreamRawData(exp):
+			analysis.Feed(chunk)
+		analysis.Finish()
+
+
+	#Follows a running experiment, e.g. python3 main.py --watch ID. Only data newer than the last poll is fetched, and steps are detected incrementally over it
+	#The report is rewritten whenever a current density step ends. Stops once the experiment's end time in the dashboard has passed, or on Ctrl+C
+	def Watch(self, pollInterval: float) -> None:
+		exp: ExperimentMeta = self.Experiments[0]
+		sensorSource: SensorDataSource = self.SensorSource(exp)
+		analysis: IncrementalAnalysis = IncrementalAnalysis(exp, self.maxPoints if self.timeseries else 0)
+
+		#The newest rows are left until they are this many seconds old, so that all of their points have arrived and been aggregated
+		SETTLE_TIME: float = 2.0 * sensorSource.aggregationWindow
+		lastTime: int = int(exp.startTime)
+
+		print ("Watching experiment labelled \"%s\". Press Ctrl+C to stop" % exp.label, file=sys.stderr)
+		try:
+			while True:
+				pollStart: float = time.time()
+				finished: bool = pollStart - SETTLE_TIME >= exp.stopTime
+				#Rows are only read up to a whole number of aggregation windows, so that none of them are partial
+				stopTime: int = int(exp.stopTime) if finished else int(pollStart - SETTLE_TIME) // sensorSource.aggregationWindow * sensorSource.aggregationWindow
+
+				if stopTime > lastTime:
+					with PROFILER.Stage("fetch", exp.label) as stage:
+						chunk: pd.DataFrame = sensorSource.Query(lastTime, stopTime)
+						stage.AddRows(chunk.shape[0])
+					lastTime = stopTime
+					if analysis.Feed(chunk):
+						self.PlotData()
+						print ("%s: %d current density steps analysed" % (time.strftime("%H:%M:%S"), len(exp.processedData)), file=sys.stderr)
+
+				if finished:
+					analysis.Finish()
+					self.PlotData()
+					return
+				time.sleep(max(pollInterval - (time.time() - pollStart), 0.0))
+		except KeyboardInterrupt:
+			print ("Stopped watching experiment labelled \"%s\"" % exp.label, file=sys.stderr)
+
+
+	#Fetches experiments on a pool of threads while earlier experiments are being processed
+	#At most jobs * 2 experiments are fetched ahead, which bounds the memory held by raw data waiting to be processed
+	#Experiments with up to date stored results are not fetched at all, and each experiment's results are stored as soon as it has been processed
+	def ProcessData(self) -> None:
+		experiments: List[ExperimentMeta] = self.Experiments
+		#Stored results don't include the sensor traces, so every experiment is fetched when they are drawn
+		if self.resultsStore and not self.timeseries:
+			experiments = self.resultsStore.LoadAll(self.Experiments)
+
+		#Experiments that are fetched whole are grouped into batched queries
+		if not (self.stream or self.pushdown):
+			self.PlanQueries(experiments)
+
+		#In streaming mode, experiments are processed one at a time so that memory use stays within the budget
+		if self.stream and not self.pushdown:
+			for exp in experiments:
+				self.AnalyseExperimentStreaming(exp)
+				self.SaveResults(exp)
+			return
+
+		if self.processes and not self.pushdown:
+			self.ProcessDataInWorkers(experiments)
+			return
+
+		#In pushdown mode, the fetch threads return window statistics instead of raw data
+		fetchFunction = self.FetchWindowStatistics if self.pushdown else self.FetchRawData
+
+		with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+			pendingFetches: deque = deque()
+			experimentIterator = iter(experiments)
+
+			for exp in itertools.islice(experimentIterator, self.jobs * 2):
+				pendingFetches.append((exp, executor.submit(fetchFunction, exp)))
+
+			#Results are consumed in the original order of the experiments
+			while pendingFetches:
+				exp, fetch = pendingFetches.popleft()
+				for nextExp in itertools.islice(experimentIterator, 1):
+					pendingFetches.append((nextExp, executor.submit(fetchFunction, nextExp)))
+
+				if self.pushdown:
+					self.AnalyseWindowStatistics(exp, fetch.result())
+				else:
+					#Create DataFrame with data for a single experiment
+					rawData: pd.DataFrame = fetch.result()
+					self.AnalyseExperiment(exp, rawData)
+				self.SaveResults(exp)
+
+	#Maps each experiment to the batched query that it will be fetched in, see query_planner.py
+	def PlanQueries(self, experiments: List[ExperimentMeta]) -> None:
+		self.queryBatches = {}
+		if self.batchSpan <= 0:
+			return
+		for batch in PlanQueries(experiments, self.sensorSource.aggregationWindow, self.batchGap, self.batchSpan, self.batchRows):
+			for exp in batch.experiments:
+				self.queryBatches[exp] = batch
+
+
+	#Process pool version of ProcessData(). Fetched data is handed to the worker processes through shared memory, and each worker returns the MetricsStore of one experiment
+	#At most processes * 2 experiments are queued for the workers, on top of those being fetched
+	def ProcessDataInWorkers(self, experiments: List[ExperimentMeta]) -> None:
+		#The blocks of shared memory that haven't been freed yet. They are freed once the workers have stopped, even if starting a worker, or a worker, fails
+		sharedFrames: List[SharedFrame] = []
+		try:
+			with ThreadPoolExecutor(max_workers=self.jobs) as executor, ProcessPoolExecutor(max_workers=self.processes, initializer=DisableProfiler) as workers:
+				pendingFetches: deque = deque()
+				pendingAnalyses: deque = deque()
+				experimentIterator = iter(experiments)
+
+				for exp in itertools.islice(experimentIterator, self.jobs * 2):
+					pendingFetches.append((exp, executor.submit(self.FetchRawData, exp)))
+
+				#Results are collected in the original order of the experiments
+				while pendingFetches or pendingAnalyses:
+					if pendingFetches and len(pendingAnalyses) < self.processes * 2:
+						exp, fetch = pendingFetches.popleft()
+						for nextExp in itertools.islice(experimentIterator, 1):
+							pendingFetches.append((nextExp, executor.submit(self.FetchRawData, nextExp)))
+
+						sharedFrame: SharedFrame = SharedFrame.FromDataFrame(fetch.result())
+						sharedFrames.append(sharedFrame)
+						pendingAnalyses.append((exp, sharedFrame, workers.submit(AnalyseSharedFrame, exp.label, exp.standID, sharedFrame)))
+					else:
+						exp, sharedFrame, analysis = pendingAnalyses.popleft()
+						try:
+							exp.processedData, exp.windowTimes = analysis.result()
+						finally:
+							sharedFrame.Unlink()
+							sharedFrames.remove(sharedFrame)
+						self.SaveResults(exp)
+		finally:
+			for sharedFrame in sharedFrames:
+				sharedFrame.Unlink()
+
+
+	def SaveResults(self, exp: ExperimentMeta) -> None:
+		if self.resultsStore:
+			self.resultsStore.Save(exp)
+
+
+	#Detects the current density steps of a single experiment and calculates the key metrics for each of them
+	@staticmethod
+	def AnalyseExperiment(exp: ExperimentMeta, rawData: pd.DataFrame) -> None:
+		if rawData.empty:
+			print ("Warning: no data was found for experiment labelled \"%s\"" % exp.label, file=sys.stderr)
+			return
 
-		query_api = client.query_api()
+		#Sort the rows by time once, so that the step indices and the data windows refer to the same row order
+		rawData, times = SortedTimes(rawData)
 
-		influxQuery: str = f'\
-	from(bucket: "MZT_Process_Components")\
-	|> range(start: {START_TIME}, stop: {STOP_TIME})\
-	|> filter(fn: (r) => r["_measurement"] == "component_value")\
-	|> filter(fn: (r) => r["location"] == "arches")\
-	|> filter(fn: (r) => r["stand_id"] == "ED002")\
-	|> toFloat()\
-	|> aggregateWindow(every: 10s, fn: mean, createEmpty: false)\
-	|> pivot(rowKey:["_time"], columnKey: ["_field","component_id"], valueColumn: "_value")\
-	|> yield(name: "ED Data")'
+		#Guess the row indices of the last 5 minutes of each current density setting
+		with PROFILER.Stage("step_detection", exp.label) as stage:
+			sliceIndices: List[int] = DetectSteps(rawData["current_PSU001"])
+			stage.AddRows(rawData.shape[0])
 
+		#Now we're gonna loop through the indices and calculate the key metrics for each current density
+		with PROFILER.Stage("metrics", exp.label) as stage:
+			EDAnalysisManager.AnalyseWindows(exp, rawData, times, sliceIndices)
+			stage.AddRows(len(sliceIndices))
 
-		return query_api.query_data_frame(org=self.INFLUXDB_ORG, query=influxQuery)
 
+	#Cuts out the 5 minutes of data ending at each slice index, and calculates the key metrics for each window
+	#The windows are positional views of rawData, found by binary search over its sorted timestamps. Only their statistics are calculated one window at a time, and the metrics of all of them are calculated at once
+	#rawData must already be sorted by time, with times holding its timestamps as returned by SortedTimes(), as the slice indices are positions in it
+	@staticmethod
+	def AnalyseWindows(exp: ExperimentMeta, rawData: pd.DataFrame, times: numpy.ndarray, sliceIndices: List[int]) -> None:
+		epochSeconds: numpy.ndarray = ToEpochSeconds(rawData["_time"])
+		windows: List[slice] = WindowSlices(times, sliceIndices)
+		if not windows:
+			return
+		statistics: List[dict] = [EDMetrics(rawData.iloc[window], epochSeconds[window]).statistics for window in windows]
+		EDAnalysisManager.AppendMetrics(exp, EDMetrics.FromStatistics(StackStatistics(statistics)))
+		exp.windowTimes.extend((int(times[window.start]), int(times[window.stop - 1])) for window in windows)
+
+
+	#Calculates the key metrics from window statistics that were calculated by the sensor data source
+	@staticmethod
+	def AnalyseWindowStatistics(exp: ExperimentMeta, statistics: List[dict]) -> None:
+		with PROFILER.Stage("metrics", exp.label) as stage:
+			for windowStatistics in statistics:
+				if windowStatistics is None:
+					print ("Warning: a data window of experiment labelled \"%s\" contained no data" % exp.label, file=sys.stderr)
+			statistics = [windowStatistics for windowStatistics in statistics if windowStatistics is not None]
+			if statistics:
+				stackedStatistics: dict = StackStatistics(statistics)
+				EDAnalysisManager.AppendMetrics(exp, EDMetrics.FromStatistics(stackedStatistics))
+				exp.windowTimes.extend(zip(numpy.round(stackedStatistics["first_epoch"] * 1e9).astype(numpy.int64).tolist(), numpy.round(stackedStatistics["last_epoch"] * 1e9).astype(numpy.int64).tolist()))
+			stage.AddRows(len(statistics))
+
+
+	#Uses a window of data to work out the key metrics, and adds them to the processedData store of the ExperimentMeta class
+	@staticmethod
+	def AnalyseWindow(exp: ExperimentMeta, dataWindow: pd.DataFrame, epochSeconds: numpy.ndarray = None) -> None:
+		EDAnalysisManager.AppendMetrics(exp, EDMetrics(dataWindow, epochSeconds))
+
+
+	#Works out the key metrics of one or more windows, checking each of them, and adds them to the processedData store of the ExperimentMeta class
+	#edMetrics may hold the statistics of a single window, or arrays of the statistics of many windows, whose metrics are then calculated as array operations
+	#Metrics that can't be calculated (NaN) are replaced by 0, with a warning for each of them
+	@staticmethod
+	def AppendMetrics(exp: ExperimentMeta, edMetrics: EDMetrics) -> None:
+		#Get current density (actual, and a categorically grouped version for graph plotting)
+		currentDensityActual, currentDensityCategorical = edMetrics.CurrentDensity()
+		currentDensityActual = numpy.atleast_1d(currentDensityActual)
+		invalidCurrentDensity: numpy.ndarray = numpy.isnan(currentDensityActual)
+		currentDensityActual = numpy.where(invalidCurrentDensity, 0.0, currentDensityActual)
+		currentDensityCategorical = numpy.where(invalidCurrentDensity, 0, numpy.atleast_1d(currentDensityCategorical))
+
+		#Get stack resistance, current efficiency, power consumption and CO2 flux
+		metrics: List[Tuple[str, str, UncertainArray]] = [
+			("stackResistance", "stack resistance", edMetrics.StackResistance()),
+			("currentEfficiency", "current efficiency", edMetrics.CurrentEfficiency()),
+			("powerConsumption", "power consumption", edMetrics.PowerConsumption()),
+			("fluxCO2", "CO2 flux", edMetrics.CO2Flux())
+		]
+		invalidMetrics: List[numpy.ndarray] = [numpy.atleast_1d(metric.Invalid()) for column, name, metric in metrics]
+
+		#Warn about each failed calculation, in order of window
+		for n in numpy.flatnonzero(numpy.logical_or.reduce([invalidCurrentDensity] + invalidMetrics)):
+			if invalidCurrentDensity[n]:
+				print ("Warning: error in calculating current density for experiment labelled \"%s\"" % exp.label, file=sys.stderr)
+			for (column, name, metric), invalid in zip(metrics, invalidMetrics):
+				if invalid[n]:
+					print ("Warning: error in calculating %s for experiment labelled:\n\t\"%s\"\n\tat current density: %f A/m^2" % (name, exp.label, currentDensityActual[n]), file=sys.stderr)
+
+		columns: dict = {"currentDensityActual" : currentDensityActual, "currentDensityCategorical" : currentDensityCategorical}
+		for (column, name, metric), invalid in zip(metrics, invalidMetrics):
+			metric = metric.Masked(invalid)
+			columns[column] = numpy.atleast_1d(metric.values)
+			columns[column + "Error"] = numpy.atleast_1d(metric.errors)
+
+		#Get capture pH range:
+		columns["capturepHStart"] = numpy.atleast_1d(edMetrics.statistics["first_pH_PH002"])
+		columns["capturepHEnd"] = numpy.atleast_1d(edMetrics.statistics["last_pH_PH002"])
+
+		#I don't like doing this, but plotly needs it. Stored as categorical columns, so it's cheap
+		exp.processedData.Extend(columns, {"label" : exp.label, "stand" : exp.standID})
+
+
+	#Writes the report of the given experiments, or of every experiment
+	def PlotData(self, experiments: List[ExperimentMeta] = None) -> None:
+		if experiments is None:
+			experiments = self.Experiments
 
-	def ProcessData(self) -> None:
-		for exp in self.Experiments:
-			#Create DataFrame with data for a single experiment
-			rawData: pd.DataFrame = self.FetchFromInfluxDB(exp)
-
-			#Logic to guess the timestamps for the last 5 minutes of each current density setting. Based on deviation of current reading from a rolling median
-			#Lots of magic numbers here, sorry :(
-			#They gave good results for me, but feel free to play around with them if they aren't working out for you
-			roll: int = 5
-			percentTolerance: float = 10.0
-			n: int = roll * 2 #index for while loop
-			currents: pd.Series = rawData["current_PSU001"]
-			sliceIndices: List(int) = []
-			while n < currents.size:
-				rollingMedian: float =  currents.rolling(roll).median()[n]
-				upperBound: float = rollingMedian * (1 + (percentTolerance/100.0))
-				lowerBound: float = rollingMedian * (1 - (percentTolerance/100.0))
-				if currents[n] > upperBound or currents[n] < lowerBound:
-					sliceIndices.append(n - 1) #n should NOT be included
-					n += roll * 2 #More magic numbers, sorry
-				n += 1
-
-			sliceIndices.append(currents.size - 5) #need an index for the endpoint as well
-
-			#Now we're gonna loop through the indices and calculate the key metrics for each current density
-			for ind in sliceIndices:
-				endTimestamp: datetime = rawData["_time"][ind]
-				startTimestamp: datetime = endTimestamp - timedelta(minutes=5)
-				dataWindow: pd.DataFrame = rawData[rawData["_time"] >= startTimestamp]
-				dataWindow = dataWindow[dataWindow["_time"] <= endTimestamp]
-
-				#Now we used the sliced data to work out the key metrics, and add them to the processedData dictionary in the ExperimentMeta classes
-
-				edMetrics: EDMetrics = EDMetrics(dataWindow)
-
-				#Get current density (actual, and a categorically grouped version for graph plotting)
-				currentDensityTuple: Tuple[float, int] = edMetrics.GetCurrentDensity()
-
-				#Ensure calculation was successful
-				if math.isnan(currentDensityTuple[0]) or math.isnan(currentDensityTuple[1]):
-					print ("Warning: error in calculating current density for experiment labelled \"%s\"" % exp.label, file=sys.stderr)
-					currentDensityTuple = (0.0, 0.0)
-
-				exp.processedData["currentDensityActual"].append(currentDensityTuple[0])
-				exp.processedData["currentDensityCategorical"].append(currentDensityTuple[1])
-
-				#Get stack resistance
-				stackResistanceTuple: Tuple[float, float] = edMetrics.GetStackResistance()
-
-				#Ensure calculation was successful
-				if math.isnan(stackResistanceTuple[0]) or math.isnan(stackResistanceTuple[1]):
-					print ("Warning: error in calculating stack resistance for experiment labelled:\n\t\"%s\"\n\tat current density: %f A/m^2" % (exp.label, currentDensityTuple[0]), file=sys.stderr)
-					stackResistanceTuple = (0.0, 0.0)
-
-				exp.processedData["stackResistance"].append(stackResistanceTuple[0])
-				exp.processedData["stackResistanceError"].append(stackResistanceTuple[1])
-
-				#Get current efficiency
-				currentEfficiencyTuple: Tuple[float, float] = edMetrics.GetCurrentEfficiency()
-
-				#Ensure calculation was successful
-				if math.isnan(currentEfficiencyTuple[0]) or math.isnan(currentEfficiencyTuple[1]):
-					print ("Warning: error in calculating current efficiency for experiment labelled:\n\t\"%s\"\n\tat current density: %f A/m^2" % (exp.label, currentDensityTuple[0]), file=sys.stderr)
-					currentEfficiencyTuple = (0.0, 0.0)
-
-				exp.processedData["currentEfficiency"].append(currentEfficiencyTuple[0])
-				exp.processedData["currentEfficiencyError"].append(currentEfficiencyTuple[1])
-
-				#Get power consumption
-				powerConsumptionTuple: Tuple[float, float] = edMetrics.GetPowerConsumption()
-
-				#Ensure calculation was successful
-				if math.isnan(powerConsumptionTuple[0]) or math.isnan(powerConsumptionTuple[1]):
-					print ("Warning: error in calculating power consumption for experiment labelled:\n\t\"%s\"\n\tat current density: %f A/m^2" % (exp.label, currentDensityTuple[0]), file=sys.stderr)
-					powerConsumptionTuple = (0.0, 0.0)
-
-				exp.processedData["powerConsumption"].append(powerConsumptionTuple[0])
-				exp.processedData["powerConsumptionError"].append(powerConsumptionTuple[1])
-
-				#Get CO2 flux
-				fluxCO2Tuple: Tuple[float, float] = edMetrics.GetCO2Flux()
-
-				#Ensure calculation was successful
-				if math.isnan(fluxCO2Tuple[0]) or math.isnan(fluxCO2Tuple[1]):
-					print ("Warning: error in calculating CO2 flux for experiment labelled:\n\t\"%s\"\n\tat current density: %f A/m^2" % (exp.label, currentDensityTuple[0]), file=sys.stderr)
-					fluxCO2Tuple = (0.0, 0.0)
-
-				exp.processedData["fluxCO2"].append(fluxCO2Tuple[0])
-				exp.processedData["fluxCO2Error"].append(fluxCO2Tuple[1])
-				
-				#I don't like doing this, but plotly needs it
-				exp.processedData["label"].append(exp.label)
-
-				#Get capture pH range:
-				exp.processedData["capturepHRange"].append(edMetrics.GetCapturepHRange())
-
-
-	def PlotData(self) -> None:
 		#Exit program if there are no valid experiments
-		if not len(self.Experiments):
+		if not len(experiments):
 			raise Exception("Error: No valid experiments found")
 
 		#Combine all processed data into 1 dataframe:
-		allProcessedData: pd.DataFrame = pd.DataFrame()
-		for exp in self.Experiments:
-			allProcessedData = pd.concat([allProcessedData, pd.DataFrame(exp.processedData)], ignore_index=True)
+		allProcessedData: pd.DataFrame = MetricsStore.Concatenate([exp.processedData for exp in experiments])
+
+		#Export the processed data for use outside of this program
+		if self.metricsOutFilename:
+			MetricsStore.Save(allProcessedData, self.metricsOutFilename)
 
 
 		"""
 		with open("debug.out", 'w', encoding="utf-8") as Writer:
 			allProcessedData.to_csv(Writer)
 		"""
-		#Make list of plots:
-		plots: List[px.plot] = []
-
-		#Actual plotting code:
-		plots.append(px.bar(allProcessedData,
-			x="currentDensityCategorical",
-			y="stackResistance",
-			error_y="stackResistanceError",
-			color="label",
-			barmode="group",
-			hover_data="capturepHRange"
-		))
-
-		plots[0].update_layout(
-			title="Stack resistance",
-			legend_title="Amine",
-			xaxis_title="Current density / A m<sup>-2</sup>",
-			yaxis_title="Stack resistance / Ω"
-		)
-
-
-		plots.append(px.bar(allProcessedData,
-			x="currentDensityCategorical",
-			y="currentEfficiency",
-			error_y="currentEfficiencyError",
-			color="label",
-			barmode="group",
-			hover_data="capturepHRange"
-			))
-
-		plots[1].update_layout(
-			title="Current efficiency",
-			legend_title="Amine",
-			xaxis_title="Current density / A m<sup>-2</sup>",
-			yaxis_title="Current efficiency / %"
-		)
-
-		plots.append(px.bar(allProcessedData,
-			x="currentDensityCategorical",
-			y="powerConsumption",
-			error_y="powerConsumptionError",
-			color="label",
-			barmode="group",
-			hover_data="capturepHRange"
-			))
-
-		plots[2].update_layout(
-			title="Power consumption",
-			legend_title="Amine",
-			xaxis_title="Current density / A m<sup>-2</sup>",
-			yaxis_title="Power consumption / kWh t<sup>-1</sup> CO<sub>2</sub>"
-		)
-
-		plots.append(px.bar(allProcessedData,
-			x="currentDensityCategorical",
-			y="fluxCO2",
-			error_y="fluxCO2Error",
-			color="label",
-			barmode="group",
-			hover_data="capturepHRange"
-			))
-
-		plots[3].update_layout(
-			title="CO<sub>2</sub> flux",
-			legend_title="Amine",
-			xaxis_title="Current density / A m<sup>-2</sup>",
-			yaxis_title="CO<sub>2</sub> flux / mg m<sup>-2</sup> s<sup>-1</sup>"
-		)
-
-		#Add plots to HTML doc:
-		with open(self.outputFilename, 'w', encoding="utf-8") as Writer:
-			Writer.write("""\
-<!DOCTYPE html>
-<html>
-<head>
-	<title>ED results</title>
-	<style>
-		.graph-column{
-			width: 45%;
-			float: left;
-			padding: 5px 12px 0px 0px;
-		}
-	</style>
-</head>
-<body>
-	<div class=\"graph-row\">\n"""
-		)
-			
-			for n in range(0, len(plots)):
-				Writer.write("<div class=\"graph-column\">\n")
-				Writer.write(plots[n].to_html(full_html=False))
-				Writer.write("</div>")
-				if n % 2 == 1:
-					Writer.write("\t</div>\n")
-					if n < (len(plots) - 1):
-						Writer.write("\t<div class=\"graph-row\">\n")
-
-			Writer.write("</body>\n</html>")
+		#Draw the plots and add them to the HTML doc:
+		with PROFILER.Stage("report") as stage:
+			reportWriter: ReportWriter = ReportWriter(self.outputFilename, self.plotlyJS, self.parallelRender, self.facetByStand)
+			renderedTimeseries: Iterator[str] = iter(())
+			if self.timeseries:
+				renderedTimeseries = reportWriter.RenderTimeseriesFigures([(exp.label, exp.traces, exp.windowTimes) for exp in experiments if exp.traces is not None and not exp.traces.empty])
+			reportWriter.Write(reportWriter.RenderBarFigures(allProcessedData), renderedTimeseries)
+			stage.AddRows(allProcessedData.shape[0])
+			stage.AddBytes(os.path.getsize(self.outputFilename))
+
+
+	#Writes the report of each job of a job file, with that job's output options. A report that can't be written doesn't stop the others
+	#Returns the number of reports that failed
+	def WriteReports(self) -> int:
+		failedReports: int = 0
+		for report, experiments in self.reports:
+			#Reports whose experiments couldn't be selected were already reported by ParseReports()
+			if experiments is None:
+				failedReports += 1
+				continue
+			self.SetUpReport(report)
+			try:
+				self.PlotData(experiments)
+			except Exception as e:
+				print ("Report %s could not be written. %s" % (self.outputFilename, e), file=sys.stderr)
+				failedReports += 1
+		return failedReports
+
+
+#Initializer of the worker processes of ProcessDataInWorkers(), which stops them from profiling, as their stages would be lost anyway
+#Top-level function so that it can be pickled when the workers are spawned. PROFILER.Disable can't be, as pickling it pickles the profiler and its lock
+def DisableProfiler() -> None:
+	PROFILER.Disable()
+
+#Worker process entry point for ProcessDataInWorkers(). Returns the metrics of one experiment and the time ranges of its windows
+#Top-level function so that it can be run in worker processes
+def AnalyseSharedFrame(label: str, standID: str, sharedFrame: SharedFrame) -> Tuple[MetricsStore, List[Tuple[int, int]]]:
+	exp: ExperimentMeta = ExperimentMeta.__new__(ExperimentMeta)
+	exp.InitialiseMembers(label, 0.0, 0.0, standID=standID)
+	EDAnalysisManager.AnalyseExperiment(exp, sharedFrame.ToDataFrame())
+	return (exp.processedData, exp.windowTimes)
+
+
+#Analyses an experiment whose data arrives in consecutive chunks, e.g. while streaming a long experiment or watching a running one
+#Only the latest chunk, plus enough preceding rows to cover a 5 minute window, is held in memory, and steps are detected incrementally
+class IncrementalAnalysis(object):
+	"""
+	Member variables:
+
+	ExperimentMeta exp;
+	IncrementalStepDetector stepDetector;
+	pd.DataFrame buffer;
+	numpy.ndarray bufferTimes;
+	int bufferOffset;
+	int maxPoints;
+	"""
+
+	#With maxPoints, the downsampled traces of the experiment are kept up to date as chunks arrive
+	def __init__(self, exp: ExperimentMeta, maxPoints: int = 0) -> None:
+		self.exp: ExperimentMeta = exp
+		self.maxPoints: int = maxPoints
+		self.stepDetector: IncrementalStepDetector = IncrementalStepDetector()
+		self.buffer: pd.DataFrame = pd.DataFrame()
+		self.bufferTimes: numpy.ndarray = numpy.empty(0, dtype=numpy.int64)
+		self.bufferOffset: int = 0 #Position of the first buffered row within the whole experiment
+
+	#Appends the next chunk of rows, and calculates the metrics of every step that ended within it. Returns the number of steps that were analysed
+	def Feed(self, chunk: pd.DataFrame) -> int:
+		if chunk.empty:
+			return 0
+		analysedSteps: int = len(self.exp.processedData)
+		if self.maxPoints:
+			self.exp.traces = MergeTraces(self.exp.traces, DownsampleTraces(chunk, self.maxPoints), self.maxPoints)
+		#Chunks follow on from each other in time, so sorting each of them keeps the buffer sorted, and the detected steps refer to the buffered row order
+		chunk, chunkTimes = SortedTimes(chunk)
+		sliceIndices: List[int] = [ind - self.bufferOffset for ind in self.stepDetector.Feed(chunk["current_PSU001"])]
+		self.buffer = pd.concat([self.buffer, chunk], ignore_index=True)
+		self.bufferTimes = numpy.concatenate([self.bufferTimes, chunkTimes])
+		EDAnalysisManager.AnalyseWindows(self.exp, self.buffer, self.bufferTimes, sliceIndices)
+
+		#Carry over the rows that a later window could still need: everything within 5 minutes of the endpoint row
+		carryFrom: int = max(self.buffer.shape[0] - ENDPOINT_OFFSET, 0)
+		carryStart: datetime = self.buffer["_time"].iloc[carryFrom] - WINDOW_LENGTH
+		firstKept: int = int(self.buffer["_time"].searchsorted(carryStart, side="left"))
+		self.buffer = self.buffer.iloc[firstKept:].reset_index(drop=True)
+		self.bufferTimes = self.bufferTimes[firstKept:]
+		self.bufferOffset += firstKept
+		return len(self.exp.processedData) - analysedSteps
+
+	#Calculates the metrics at the endpoint of the experiment, once all of its data has been fed
+	def Finish(self) -> None:
+		if self.buffer.empty:
+			print ("Warning: no data was found for experiment labelled \"%s\"" % self.exp.label, file=sys.stderr)
+			return
+		EDAnalysisManager.AnalyseWindows(self.exp, self.buffer, self.bufferTimes, [self.stepDetector.EndpointIndex() - self.bufferOffset])
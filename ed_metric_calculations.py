@@ -1,13 +1,77 @@
-from typing import Type, Tuple
+from typing import Type, Tuple, List
+from functools import cached_property
+import numpy
 import pandas as pd
 import sys
 import math
 import datetime
 import time
 
+#Import project files
+from time_conversion import ToEpochSeconds
+from uncertain_array import UncertainArray
+
+#Sensor channels (InfluxDB field and component ID, joined by "_") that the metrics are calculated from. Sensor data sources only query and keep these
+#Values are stored as float32, apart from the current, which step detection compares against thresholds and is kept as float64 so that windows are found exactly as before
+REQUIRED_CHANNELS: List[str] = ["current_PSU001", "voltage_PSU001", "CO2_PPM_CO2001", "volumetric_flow_MFM001", "pH_PH002"]
+CHANNEL_DTYPES: dict = {channel : numpy.float32 for channel in REQUIRED_CHANNELS}
+CHANNEL_DTYPES["current_PSU001"] = numpy.float64
+
+#Summary statistics of a data window. They are all that is needed to calculate the key metrics, so they can also be calculated by the database (see InfluxSensorDataSource.QueryWindowStatistics())
+#"power" is current * voltage in W and "co2Volume" is the volumetric flow of CO2 in L/s. Epochs are UNIX timestamps in seconds, and "rows" is the number of rows in the window
+WINDOW_STATISTICS: List[str] = [
+	"rows",
+	"mean_current_PSU001",
+	"std_current_PSU001",
+	"integral_current_PSU001",
+	"mean_voltage_PSU001",
+	"std_voltage_PSU001",
+	"std_power",
+	"integral_power",
+	"std_co2Volume",
+	"integral_co2Volume",
+	"first_pH_PH002",
+	"last_pH_PH002",
+	"first_epoch",
+	"last_epoch"
+]
+
+#Combines the statistics of several windows into one dict of arrays, which EDMetrics.FromStatistics() calculates the metrics of all at once
+def StackStatistics(statistics: List[dict]) -> dict:
+	return {statistic : numpy.array([windowStatistics[statistic] for windowStatistics in statistics], dtype=numpy.float64) for statistic in WINDOW_STATISTICS}
+
+
 #Class that is initialised using a slice of a DataFrame and calculates key performance metrics
 class EDMetrics(object):
-	def __init__(self, inputDataWindow: pd.DataFrame) -> None:
+	#inputDataWindow may be a positional view into a larger DataFrame. If the UNIX timestamps of the window are already known, they can be passed as epochSeconds
+	def __init__(self, inputDataWindow: pd.DataFrame, epochSeconds: numpy.ndarray = None) -> None:
+		self.InitialiseConstants()
+
+		#Make input DataFrame available to all member functions
+		self.dataWindow: pd.DataFrame = inputDataWindow
+		if epochSeconds is not None:
+			self.epochSeconds = epochSeconds
+
+		#All metrics are calculated from summary statistics of the window
+		self.statistics: dict = self.CalculateStatistics()
+
+	#Alternative constructor for when the summary statistics of a window were calculated elsewhere, e.g. by the database. statistics must contain every key in WINDOW_STATISTICS
+	#The statistics may also be arrays holding the statistics of many windows (see StackStatistics()), in which case every metric is calculated for all of them at once
+	@classmethod
+	def FromStatistics(cls, statistics: dict) -> "EDMetrics":
+		edMetrics: EDMetrics = cls.__new__(cls)
+		edMetrics.InitialiseConstants()
+		edMetrics.statistics = statistics
+		return edMetrics
+
+	#Returns the constants used in calculations, e.g. to check whether stored results are still valid
+	@classmethod
+	def Constants(cls) -> dict:
+		edMetrics: EDMetrics = cls.__new__(cls)
+		edMetrics.InitialiseConstants()
+		return vars(edMetrics)
+
+	def InitialiseConstants(self) -> None:
 		#Define constants used in calculations
 		self.MEMBRANE_AREA: float = 0.0036 #m^2
 		self.FARADAY_CONSTANT: float = 96485.0 #C mol^{-1}
@@ -16,12 +80,6 @@ class EDMetrics(object):
 		self.CO2_MOLAR_MASS: float = 44.01 #g mol^{-1}
 		self.BICARBONATE_CHARGE: float = 1.0 #dimensionless
 
-		#Make input DataFrame available to all member functions
-		self.dataWindow: pd.DataFrame = inputDataWindow
-
-		#Load some derived values that are often reused across key metric calculations
-		self.totalMolesCO2: Tuple[float, float] = self.GetMolesCO2()
-
 #########################################################
 #DEFINE STATIC FUNCTIONS WITH BASIC ARITHMETIC OPERATIONS
 #########################################################
@@ -48,170 +106,195 @@ class EDMetrics(object):
 
 	#Integrates series y wrt series x by drawing trapezia between each set of data points and adding their areas
 	@staticmethod
-	def Integrate(xSeries: pd.Series, ySeries: pd.Series) -> Tuple[float, float]:
-		#Initialize variables for integration loop
-		integral: float = 0.0
-		x: float = 0.0
-		y: float = 0.0
-		x1: float = xSeries.iloc[0]
-		y1: float = ySeries.iloc[0]
-		seriesLength: int = xSeries.size
-
-		#Ensure the length of the two series matches. If not, sets seriesLength to that of the smaller series so as to avoid an index out of range error in the loop
-		if seriesLength != ySeries.size:
+	def Integrate(xSeries, ySeries) -> Tuple[float, float]:
+		xArray: numpy.ndarray = numpy.asarray(xSeries, dtype=numpy.float64)
+		yArray: numpy.ndarray = numpy.asarray(ySeries, dtype=numpy.float64)
+		seriesLength: int = xArray.size
+
+		#Ensure the length of the two series matches. If not, sets seriesLength to that of the smaller series so as to avoid an index out of range error
+		if seriesLength != yArray.size:
 			print ("WARNING: integration error: lengths of x and y series do not match", file=sys.stderr)
-			if seriesLength > ySeries.size:
-				seriesLength = ySeries
-		
-		#Actual integration loop
-		for n in range(1, seriesLength):
-			x = x1
-			y = y1
-			x1 = xSeries.iloc[n]
-			y1 = ySeries.iloc[n]
-
-			trapeziumArea: float = ((y + y1) / 2.0) * (x1 - x)
-			integral += trapeziumArea
-		
-		error = ySeries.size * ySeries.std()
+			seriesLength = min(seriesLength, yArray.size)
+
+		#Sum the areas of all trapezia in one pass over contiguous arrays
+		x: numpy.ndarray = xArray[:seriesLength]
+		y: numpy.ndarray = yArray[:seriesLength]
+		integral: float = float(numpy.sum(((y[1:] + y[:-1]) / 2.0) * numpy.diff(x)))
+
+		error = yArray.size * pd.Series(yArray).std()
 		return (integral, error)
 
 ############################################
 #DEFINE PRIVATE, NON-STATIC MEMBER FUNCTIONS
 ############################################
 
-	def GetMolesCO2(self) -> Tuple[float, float]:
+	#UNIX timestamps of the window in seconds. Computed once per window and shared by all metrics
+	@cached_property
+	def epochSeconds(self) -> numpy.ndarray:
+		return ToEpochSeconds(self.dataWindow["_time"])
+
+	#Returns a channel of the window as float64, as sensor data may be stored in compact dtypes (see CHANNEL_DTYPES)
+	def Channel(self, channel: str) -> pd.Series:
+		return self.dataWindow[channel].astype(numpy.float64, copy=False)
+
+	#Electrical power drawn by the stack in W
+	@cached_property
+	def powerSeries(self) -> pd.Series:
+		return self.Channel("current_PSU001").multiply(self.Channel("voltage_PSU001"))
+
+	#Volumetric flow of CO2 in L/s
+	@cached_property
+	def co2VolumeSeries(self) -> pd.Series:
 		#Convert CO2 ppm into fraction of CO2
-		co2FractionSeries: pd.Series = self.dataWindow["CO2_PPM_CO2001"].apply(lambda x: x / 1000000.0)
+		co2FractionSeries: pd.Series = self.Channel("CO2_PPM_CO2001") / 1000000.0
 		#Convert air volumetric flow from litres/minute to litres/second
-		airVolumetricFlowSeries: pd.Series = self.dataWindow["volumetric_flow_MFM001"].apply(lambda x: x / 60.0)
-		#Convert timestamp from some ugly string to UNIX timestamp
-		timeSeries: pd.Series = self.dataWindow["_time"].apply(self.ToUNIXTime)
+		airVolumetricFlowSeries: pd.Series = self.Channel("volumetric_flow_MFM001") / 60.0
 
 		#Combine CO2 fraction and air volumetric flow series to get CO2 volume
-		co2VolumeSeries: pd.Series = co2FractionSeries.multiply(airVolumetricFlowSeries, fill_value=0.0)
-
-		#Get error of CO2 volume
-		co2VolumeError: float = co2VolumeSeries.std()
+		return co2FractionSeries.multiply(airVolumetricFlowSeries, fill_value=0.0)
+
+	#Calculates the summary statistics in WINDOW_STATISTICS from the rows of the window
+	def CalculateStatistics(self) -> dict:
+		statistics: dict = {"rows" : self.dataWindow.shape[0]}
+		currentSeries: pd.Series = self.Channel("current_PSU001")
+		voltageSeries: pd.Series = self.Channel("voltage_PSU001")
+
+		statistics["mean_current_PSU001"] = currentSeries.mean()
+		statistics["std_current_PSU001"] = currentSeries.std()
+		statistics["integral_current_PSU001"] = self.Integrate(self.epochSeconds, currentSeries)[0]
+		statistics["mean_voltage_PSU001"] = voltageSeries.mean()
+		statistics["std_voltage_PSU001"] = voltageSeries.std()
+		statistics["std_power"] = self.powerSeries.std()
+		statistics["integral_power"] = self.Integrate(self.epochSeconds, self.powerSeries)[0]
+		statistics["std_co2Volume"] = self.co2VolumeSeries.std()
+		statistics["integral_co2Volume"] = self.Integrate(self.epochSeconds, self.co2VolumeSeries)[0]
+
+		pHSeries: pd.Series = self.Channel("pH_PH002")
+		statistics["first_pH_PH002"] = pHSeries.iloc[0]
+		statistics["last_pH_PH002"] = pHSeries.iloc[pHSeries.size - 1]
+		statistics["first_epoch"] = self.epochSeconds[0]
+		statistics["last_epoch"] = self.epochSeconds[self.epochSeconds.size - 1]
+		return statistics
+
+	#Returns the integral of a channel over the window, with the same error as Integrate()
+	def IntegralStatistic(self, channel: str) -> UncertainArray:
+		return UncertainArray(self.statistics["integral_" + channel], self.statistics["rows"] * self.statistics["std_" + channel])
+
+	#Total CO2 evolved over the window in mol
+	@cached_property
+	def totalMolesCO2(self) -> UncertainArray:
 		#Get total CO2 volume via integration over time
-		outputTuple: Tuple[float, float] = self.Integrate(timeSeries, co2VolumeSeries)
+		output: UncertainArray = self.IntegralStatistic("co2Volume")
 
 		#Convert L CO2 to g CO2
-		outputTuple = self.ErrorMultiply(outputTuple, (self.CO2_DENSITY, 0.0))
+		output = output * self.CO2_DENSITY
 		#Convert g CO2 to mol CO2
-		outputTuple = self.ErrorDivide(outputTuple, (self.CO2_MOLAR_MASS, 0.0))
-		
-		return outputTuple
+		output = output / self.CO2_MOLAR_MASS
+
+		return output
+
+	def GetMolesCO2(self) -> Tuple[float, float]:
+		return self.totalMolesCO2.ToTuple()
 
 ###########################################
 #DEFINE PUBLIC, NON-STATIC MEMBER FUNCTIONS
 ###########################################
 
-	#Returns a tuple. 0th element is actual current density, 1st is categorical current density needed for bar plotting
-	def GetCurrentDensity(self) -> Tuple[float, int]:
+#The following functions work on UncertainArrays, so when the statistics hold arrays (see StackStatistics()), each metric is calculated for every window at once
+#Errors are combined exactly as by ErrorDivide() and ErrorMultiply(). The Get...() functions return the same metrics as (value, error) tuples for a single window
+
+	#Returns the actual current densities, and the categorical current densities needed for bar plotting
+	def CurrentDensity(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
 		#Parses current densities into well-defined categories to group bars together
-		currentDensities: List[float] = [120.0, 200.0, 280.0, 360.0, 440.0, 520.0]
+		currentDensities: numpy.ndarray = numpy.array([120.0, 200.0, 280.0, 360.0, 440.0, 520.0])
 
 		#Calculate ACTUAL current density
-		#Extract current from dataframe:
-		actualCurrentDensity: float = self.dataWindow["current_PSU001"].mean() / self.MEMBRANE_AREA
+		actualCurrentDensity: numpy.ndarray = numpy.asarray(self.statistics["mean_current_PSU001"], dtype=numpy.float64) / self.MEMBRANE_AREA
 
-		#Now we see which category the actual value is closest to
-		outputIndex: int = 0
-		for n in range(1, len(currentDensities)):
-			diff: float = abs(currentDensities[n] - actualCurrentDensity)
-			best: float = abs(currentDensities[outputIndex] - actualCurrentDensity)
-			if diff < best:
-				outputIndex = n
-		return (actualCurrentDensity, int(currentDensities[outputIndex]))
+		#Now we see which category the actual value is closest to. Ties go to the lower category
+		outputIndices: numpy.ndarray = numpy.argmin(numpy.abs(currentDensities - actualCurrentDensity[..., numpy.newaxis]), axis=-1)
+		return (actualCurrentDensity, currentDensities[outputIndices].astype(numpy.int64))
 
-
-#In the following functions, numbers are stored as tuples of format (data, error)
-
-	def GetStackResistance(self) -> Tuple[float, float]:
-		#Extract values and errors from dataframe:
-		current: Tuple[float, float] = (self.dataWindow["current_PSU001"].mean(), self.dataWindow["current_PSU001"].std())
-		voltage: Tuple[float, float] = (self.dataWindow["voltage_PSU001"].mean(), self.dataWindow["voltage_PSU001"].std())
+	def StackResistance(self) -> UncertainArray:
+		#Extract values and errors from the window statistics:
+		current: UncertainArray = UncertainArray(self.statistics["mean_current_PSU001"], self.statistics["std_current_PSU001"])
+		voltage: UncertainArray = UncertainArray(self.statistics["mean_voltage_PSU001"], self.statistics["std_voltage_PSU001"])
 
 		#Perform arithmetic
-		resistance = self.ErrorDivide(voltage, current)
-		return resistance
-
-	def GetCurrentEfficiency(self) -> Tuple[float, float]:
-		#Extract values and errors from dataframe:
-		currentSeries: pd.Series = self.dataWindow["current_PSU001"]
-		timeSeries: pd.Series = self.dataWindow["_time"].apply(self.ToUNIXTime)
-
-		#Begin arithmetic
-		currentEfficiency: Tuple[float, float] = (0.0, 0.0)
+		return voltage / current
 
+	def CurrentEfficiency(self) -> UncertainArray:
 		#Work out total number of mol of electrons passed:
-		molElectrons: Tuple[float, float] = self.Integrate(timeSeries, currentSeries) #Gives total coulombs passed
-		molElectrons = self.ErrorDivide(molElectrons, (self.FARADAY_CONSTANT, 0.0))
+		molElectrons: UncertainArray = self.IntegralStatistic("current_PSU001") #Gives total coulombs passed
+		molElectrons = molElectrons / self.FARADAY_CONSTANT
 
 		#Work out mol of CO2 per mol of e-
-		currentEfficiency = self.ErrorDivide(self.totalMolesCO2, molElectrons)
+		currentEfficiency: UncertainArray = self.totalMolesCO2 / molElectrons
 		#Convert to %
-		currentEfficiency = self.ErrorMultiply(currentEfficiency, (100.0, 0.0))
+		currentEfficiency = currentEfficiency * 100.0
 		#Work out CE per cell pair
-		currentEfficiency = self.ErrorDivide(currentEfficiency, (self.MEMBRANE_PAIRS, 0.0))
+		currentEfficiency = currentEfficiency / self.MEMBRANE_PAIRS
 
-		return currentEfficiency	
-
-
-	def GetPowerConsumption(self) -> Tuple[float, float]:
-		#Extract values and errors from dataframe:
-		powerSeries: pd.Series = self.dataWindow["current_PSU001"].multiply(self.dataWindow["voltage_PSU001"])
-		timeSeries: pd.Series = self.dataWindow["_time"].apply(self.ToUNIXTime)
-
-		#Begin arithmetic
-		powerConsumption: Tuple[float, float] = (0.0, 0.0)
+		return currentEfficiency
 
+	def PowerConsumption(self) -> UncertainArray:
 		#Work out total energy in J
-		totalEnergy: Tuple[float, float] = self.Integrate(timeSeries, powerSeries)
+		totalEnergy: UncertainArray = self.IntegralStatistic("power")
 
 		#Convert energy to kWh
-		totalEnergy = self.ErrorDivide(totalEnergy, (3600000.0, 0.0))
+		totalEnergy = totalEnergy / 3600000.0
 
 		#Work out total g CO2
-		massCO2: Tuple[float, float] = self.ErrorMultiply(self.totalMolesCO2, (self.CO2_MOLAR_MASS, 0.0))
+		massCO2: UncertainArray = self.totalMolesCO2 * self.CO2_MOLAR_MASS
 
 		#Convert mass to tons
-		massCO2 = self.ErrorDivide(massCO2, (1000000.0, 0.0))
+		massCO2 = massCO2 / 1000000.0
 
 		#Work out kWh per ton CO2
-		powerConsumption = self.ErrorDivide(totalEnergy, massCO2)
-
-		return powerConsumption
-
+		return totalEnergy / massCO2
 
-	def GetCO2Flux(self) -> Tuple[float, float]:
+	def CO2Flux(self) -> UncertainArray:
 		#Get duration of relevant data window in s
-		timeSeries: pd.Series = self.dataWindow["_time"].apply(self.ToUNIXTime)
-		duration: float = timeSeries.iloc[timeSeries.size - 1] - timeSeries.iloc[0]
-
-		#Begin arithmetic
-		fluxCO2: Tuple[float, float] = (0.0, 0.0)
+		duration: numpy.ndarray = numpy.asarray(self.statistics["last_epoch"], dtype=numpy.float64) - numpy.asarray(self.statistics["first_epoch"], dtype=numpy.float64)
 
 		#Work out total mass of CO2 evolved in g
-		massCO2: Tuple[float, float] = self.ErrorMultiply(self.totalMolesCO2, (self.CO2_MOLAR_MASS, 0.0))
+		massCO2: UncertainArray = self.totalMolesCO2 * self.CO2_MOLAR_MASS
 		#Convert mass to mg
-		massCO2 = self.ErrorMultiply(massCO2, (1000.0, 0.0))
+		massCO2 = massCO2 * 1000.0
 
 		#Work out CO2 evolution rate in mg/s
-		rateCO2: Tuple[float, float] = self.ErrorDivide(massCO2, (duration, 0.0))
+		rateCO2: UncertainArray = massCO2 / duration
 
 		#Work out total membrane area:
-		totalArea: Tuple[float, float] = (self.MEMBRANE_PAIRS * self.MEMBRANE_AREA, 0.0)
+		totalArea: float = self.MEMBRANE_PAIRS * self.MEMBRANE_AREA
 
 		#Work out CO2 flux
-		fluxCO2 = self.ErrorDivide(rateCO2, totalArea)
+		return rateCO2 / totalArea
+
+	#Returns a tuple. 0th element is actual current density, 1st is categorical current density needed for bar plotting
+	def GetCurrentDensity(self) -> Tuple[float, int]:
+		actualCurrentDensity, categoricalCurrentDensity = self.CurrentDensity()
+		return (float(actualCurrentDensity), int(categoricalCurrentDensity))
+
+#In the following functions, numbers are stored as tuples of format (data, error)
+
+	def GetStackResistance(self) -> Tuple[float, float]:
+		return self.StackResistance().ToTuple()
+
+	def GetCurrentEfficiency(self) -> Tuple[float, float]:
+		return self.CurrentEfficiency().ToTuple()
+
+	def GetPowerConsumption(self) -> Tuple[float, float]:
+		return self.PowerConsumption().ToTuple()
+
+	def GetCO2Flux(self) -> Tuple[float, float]:
+		return self.CO2Flux().ToTuple()
 
-		return fluxCO2
+	#Returns the capture pH at the start and end of the window
+	def GetCapturepH(self) -> Tuple[float, float]:
+		return (self.statistics["first_pH_PH002"], self.statistics["last_pH_PH002"])
 
 	def GetCapturepHRange(self) -> Tuple[float, float]:
-		pHSeries: pd.Series = self.dataWindow["pH_PH002"]
-		lastIndex: int = pHSeries.size - 1
-		op: str = "%f -> %f" % (pHSeries.iloc[0], pHSeries.iloc[lastIndex])
+		op: str = "%f -> %f" % (self.statistics["first_pH_PH002"], self.statistics["last_pH_PH002"])
 		#return (pHSeries[0], pHSeries[lastIndex])
 		return op
@@ -0,0 +1,164 @@
+from typing import List, Tuple
+import numpy
+import pandas as pd
+import sqlite3
+import os
+import sys
+import time
+
+#Import project files
+from experiment_meta import ExperimentMeta, DashboardText
+from time_conversion import ToEpochSeconds
+
+#Bump this whenever the schema changes, so that catalogs written by older versions are rebuilt
+CATALOG_VERSION: int = 1
+
+
+#Local SQLite catalog of the experiments in the dashboard: their ID, label, start and end times, location, stand and whether they are completed
+#Experiments are selected from the catalog rather than from the dashboard, using indexes on the start time, label and stand, so a selection such as "every experiment started in Q3 on ED002" doesn't need the dashboard to be downloaded or parsed
+#The catalog is rebuilt from the dashboard whenever the dashboard is loaded. Stands and locations that are empty in the dashboard are stored as "", and the defaults of the run are applied when experiments are selected
+class ExperimentCatalog(object):
+	"""
+	Member variables:
+
+	char *catalogPath;
+	sqlite3.Connection connection;
+	"""
+
+	#Experiments are stored in the order of the dashboard, which decides which row is used if an experiment ID appears more than once
+	SCHEMA: str = """
+		CREATE TABLE IF NOT EXISTS experiments (
+			position INTEGER PRIMARY KEY,
+			experimentID TEXT NOT NULL,
+			label TEXT,
+			startTime REAL,
+			stopTime REAL,
+			location TEXT NOT NULL,
+			standID TEXT NOT NULL,
+			completed INTEGER NOT NULL
+		);
+		CREATE INDEX IF NOT EXISTS experiments_experimentID ON experiments (experimentID);
+		CREATE INDEX IF NOT EXISTS experiments_startTime ON experiments (startTime);
+		CREATE INDEX IF NOT EXISTS experiments_label ON experiments (label);
+		CREATE INDEX IF NOT EXISTS experiments_standID ON experiments (standID, startTime);
+		CREATE TABLE IF NOT EXISTS sync (
+			source TEXT PRIMARY KEY,
+			syncedAt REAL NOT NULL
+		);
+	"""
+
+	#With the default path, the catalog is only kept in memory for the length of the run
+	def __init__(self, catalogPath: str = ":memory:") -> None:
+		self.catalogPath: str = catalogPath
+		try:
+			self.connection: sqlite3.Connection = self.Connect()
+		except sqlite3.DatabaseError:
+			print ("Warning: experiment catalog %s is unreadable and will be rebuilt" % catalogPath, file=sys.stderr)
+			os.remove(catalogPath)
+			self.connection = self.Connect()
+
+	def Connect(self) -> sqlite3.Connection:
+		connection: sqlite3.Connection = sqlite3.connect(self.catalogPath)
+		if connection.execute("PRAGMA user_version").fetchone()[0] != CATALOG_VERSION:
+			connection.executescript("DROP TABLE IF EXISTS experiments; DROP TABLE IF EXISTS sync; PRAGMA user_version = %d;" % CATALOG_VERSION)
+		connection.executescript(self.SCHEMA)
+		return connection
+
+	def Close(self) -> None:
+		self.connection.close()
+
+
+	#Returns how many seconds ago the catalog was built from the given source (e.g. a Notion database ID), or infinity if it never was
+	def Age(self, source: str) -> float:
+		row: tuple = self.connection.execute("SELECT syncedAt FROM sync WHERE source = ?", (source,)).fetchone()
+		if row is None:
+			return float("inf")
+		return time.time() - row[0]
+
+	#Replaces the contents of the catalog with the experiments in a dashboard, which was loaded from the given source
+	def Update(self, notionDashboard: pd.DataFrame, source: str) -> None:
+		rowCount: int = notionDashboard.shape[0]
+		startTimes: numpy.ndarray = ToEpochSeconds(notionDashboard["Start Date & Time"])
+		stopTimes: numpy.ndarray = ToEpochSeconds(notionDashboard["End Date & Time"])
+		#The dashboard may already be indexed by experiment ID
+		if "Experimental Name" in notionDashboard.columns:
+			experimentIDs: numpy.ndarray = notionDashboard["Experimental Name"].to_numpy()
+		else:
+			experimentIDs = notionDashboard.index.to_numpy()
+		labels: numpy.ndarray = notionDashboard["Label"].to_numpy()
+		locations: List[str] = [DashboardText(value) for value in notionDashboard.get("Location", [None] * rowCount)]
+		standIDs: List[str] = [DashboardText(value) for value in notionDashboard.get("Stand", [None] * rowCount)]
+		completed: numpy.ndarray = notionDashboard["Completed"].fillna(False).to_numpy(dtype=bool)
+
+		rows: List[tuple] = []
+		for n in range(0, rowCount):
+			rows.append((n, str(experimentIDs[n]), None if labels[n] is None else str(labels[n]), None if numpy.isnan(startTimes[n]) else float(startTimes[n]), None if numpy.isnan(stopTimes[n]) else float(stopTimes[n]), locations[n], standIDs[n], int(completed[n])))
+
+		#Rebuilt in one transaction, so that an interrupted run leaves the previous catalog in place
+		with self.connection:
+			self.connection.execute("DELETE FROM experiments")
+			self.connection.executemany("INSERT INTO experiments VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+			self.connection.execute("DELETE FROM sync")
+			self.connection.execute("INSERT INTO sync VALUES (?, ?)", (source, time.time()))
+
+
+	#Dependency for the Select functions. Returns the WHERE clause and parameters that restrict the experiments to those started in [since, until), with labels matching the glob pattern, on the given stand
+	#Experiments without a stand in the dashboard are on defaultStandID
+	@staticmethod
+	def SelectorClause(since: float = None, until: float = None, pattern: str = None, stand: str = None, defaultStandID: str = "") -> Tuple[str, list]:
+		conditions: List[str] = []
+		parameters: list = []
+		if since is not None:
+			conditions.append("startTime >= ?")
+			parameters.append(since)
+		if until is not None:
+			conditions.append("startTime < ?")
+			parameters.append(until)
+		if pattern:
+			conditions.append("label GLOB ?")
+			parameters.append(pattern)
+		if stand:
+			if stand == defaultStandID:
+				conditions.append("standID IN (?, '')")
+			else:
+				conditions.append("standID = ?")
+			parameters.append(stand)
+		return (" AND ".join(["1"] + conditions), parameters)
+
+	#Dependency for the Select functions. Builds an ExperimentMeta object for each row, skipping those without a start or end time
+	@staticmethod
+	def RowsToExperiments(rows: List[tuple], location: str, standID: str) -> List[ExperimentMeta]:
+		op: List[ExperimentMeta] = []
+		for experimentID, label, startTime, stopTime, experimentLocation, experimentStandID in rows:
+			if startTime is None or stopTime is None:
+				print ("Warning: experiment labelled \"%s\" has no start or end time and will be skipped" % label, file=sys.stderr)
+				continue
+			exp: ExperimentMeta = ExperimentMeta.__new__(ExperimentMeta)
+			exp.InitialiseMembers(label, startTime, stopTime, experimentID, experimentLocation or location, experimentStandID or standID)
+			op.append(exp)
+		return op
+
+	#Returns the experiments with the given IDs that match the selectors, in the order that the IDs are given. If an ID appears more than once in the dashboard, its first row is used
+	#Returns the IDs that aren't in the catalog too
+	def SelectIDs(self, experimentIDs: List[str], location: str, standID: str, **selectors) -> Tuple[List[ExperimentMeta], List[str]]:
+		whereClause, parameters = self.SelectorClause(defaultStandID=standID, **selectors)
+		rows: List[tuple] = []
+		missingIDs: List[str] = []
+		for experimentID in experimentIDs:
+			row: tuple = self.connection.execute("SELECT experimentID, label, startTime, stopTime, location, standID, %s FROM experiments WHERE experimentID = ? ORDER BY position LIMIT 1" % whereClause, parameters + [experimentID]).fetchone()
+			if row is None:
+				missingIDs.append(experimentID)
+			elif row[-1]:
+				rows.append(row[:-1])
+		return (self.RowsToExperiments(rows, location, standID), missingIDs)
+
+	#Returns the completed experiments that match the selectors, apart from those with an excluded ID, in the order of the dashboard
+	def SelectCompleted(self, location: str, standID: str, excludedIDs: List[str] = [], **selectors) -> List[ExperimentMeta]:
+		whereClause, parameters = self.SelectorClause(defaultStandID=standID, **selectors)
+		excludedIDs = set(excludedIDs)
+		rows: List[tuple] = [row for row in self.connection.execute("SELECT experimentID, label, startTime, stopTime, location, standID FROM experiments WHERE completed = 1 AND %s ORDER BY position" % whereClause, parameters) if row[0] not in excludedIDs]
+		return self.RowsToExperiments(rows, location, standID)
+
+	#Returns the number of completed experiments in the catalog
+	def CountCompleted(self) -> int:
+		return self.connection.execute("SELECT COUNT(*) FROM experiments WHERE completed = 1").fetchone()[0]
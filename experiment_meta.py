@@ -1,44 +1,92 @@
 import typing
+from typing import List, Tuple
+import numpy
 import pandas as pd
 import datetime
+import sys
 import time
+import math
+
+#Import project files
+from time_conversion import ToEpochSeconds
+from metrics_store import MetricsStore
+
+#Returns the text of a dashboard cell, or default if it's empty. Select properties may be loaded from Notion as lists, in which case the first option is used
+def DashboardText(value, default: str = "") -> str:
+	if isinstance(value, (list, tuple, numpy.ndarray)):
+		value = value[0] if len(value) else None
+	if value is None or (isinstance(value, float) and math.isnan(value)) or str(value).strip() == "":
+		return default
+	return str(value).strip()
+
 
 class ExperimentMeta(object):
 	"""
 	Member variables:
 
 	char *label;
+	char *experimentID;
+	char *location;
+	char *standID;
 	float startTime;
 	float stopTime;
-	dict processedData;
+	MetricsStore processedData;
+	Tuple *windowTimes;
+	pd.DataFrame traces;
 	"""
 
 	def __init__(self, notionDashboard: pd.Series) -> None:
-		self.label: str = notionDashboard.loc["Label"]
 		startDatetimeString: datetime = notionDashboard.loc["Start Date & Time"].to_pydatetime()
 		stopDatetimeString: datetime = notionDashboard.loc["End Date & Time"].to_pydatetime()
 
 		# Convert times to UNIX epoch time (needed for InfluxDB query)
-		self.startTime: float = self.ToUNIXTime(startDatetimeString)
-		self.stopTime: float = self.ToUNIXTime(stopDatetimeString)
+		self.InitialiseMembers(notionDashboard.loc["Label"], self.ToUNIXTime(startDatetimeString), self.ToUNIXTime(stopDatetimeString), str(notionDashboard.get("Experimental Name", notionDashboard.name)), DashboardText(notionDashboard.get("Location")), DashboardText(notionDashboard.get("Stand")))
+
+	#Builds ExperimentMeta objects for every row of a (filtered) Notion dashboard
+	#Start and stop times are converted column-wise rather than row by row. Rows without valid times are skipped
+	#The stand and location are read from the "Stand" and "Location" columns, if the dashboard has them. Otherwise, or where they're empty, the given defaults are used
+	#With openEnded, experiments without an end time (e.g. ones that are still running) are kept, with an end time of infinity
+	@classmethod
+	def FromDashboard(cls, notionDashboard: pd.DataFrame, location: str = "", standID: str = "", openEnded: bool = False) -> List["ExperimentMeta"]:
+		startTimes: numpy.ndarray = ToEpochSeconds(notionDashboard["Start Date & Time"])
+		stopTimes: numpy.ndarray = ToEpochSeconds(notionDashboard["End Date & Time"])
+		if openEnded:
+			stopTimes[numpy.isnan(stopTimes)] = numpy.inf
+		labels: numpy.ndarray = notionDashboard["Label"].to_numpy()
+		#The dashboard may already be indexed by experiment ID
+		if "Experimental Name" in notionDashboard.columns:
+			experimentIDs: numpy.ndarray = notionDashboard["Experimental Name"].to_numpy()
+		else:
+			experimentIDs = notionDashboard.index.to_numpy()
+		locations: List[str] = [DashboardText(value, location) for value in notionDashboard.get("Location", [None] * notionDashboard.shape[0])]
+		standIDs: List[str] = [DashboardText(value, standID) for value in notionDashboard.get("Stand", [None] * notionDashboard.shape[0])]
+
+		op: List[ExperimentMeta] = []
+		for label, startTime, stopTime, experimentID, experimentLocation, experimentStandID in zip(labels, startTimes, stopTimes, experimentIDs, locations, standIDs):
+			if numpy.isnan(startTime) or numpy.isnan(stopTime):
+				print ("Warning: experiment labelled \"%s\" has no start or end time and will be skipped" % label, file=sys.stderr)
+				continue
+			exp: ExperimentMeta = cls.__new__(cls)
+			exp.InitialiseMembers(label, float(startTime), float(stopTime), str(experimentID), experimentLocation, experimentStandID)
+			op.append(exp)
+		return op
+
+	def InitialiseMembers(self, label: str, startTime: float, stopTime: float, experimentID: str = "", location: str = "", standID: str = "") -> None:
+		self.label: str = label
+		self.experimentID: str = experimentID
+		self.location: str = location
+		self.standID: str = standID
+		self.startTime: float = startTime
+		self.stopTime: float = stopTime
 
 		#print (f"{self.label}: {self.startTime}, {self.stopTime}")
 
 		#Forward declarations of member variables:
-		self.processedData: dict = {
-			"currentDensityActual" : [],
-			"currentDensityCategorical" : [],
-			"stackResistance" : [],
-			"stackResistanceError" : [],
-			"currentEfficiency" : [],
-			"currentEfficiencyError" : [],
-			"powerConsumption" : [],
-			"powerConsumptionError" : [],
-			"fluxCO2" : [],
-			"fluxCO2Error" : [],
-			"label" : [],
-			"capturepHRange" : []
-		}
+		self.processedData: MetricsStore = MetricsStore()
+		#[start, stop] of the data window of each row of processedData, in int64 nanoseconds, for shading the time series figures
+		self.windowTimes: List[Tuple[int, int]] = []
+		#Downsampled sensor traces, only kept with --timeseries (see downsampling.py)
+		self.traces: pd.DataFrame = None
 
 	
 	def ToUNIXTime(self, ip: datetime) -> float:
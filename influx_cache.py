@@ -0,0 +1,246 @@
+from typing import List, Tuple, Callable, Dict
+from contextlib import ExitStack
+import numpy
+import pandas as pd
+import hashlib
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+#Local, on-disk cache of InfluxDB query results
+#The data of each (bucket, stand_id, location, aggregation window, channels) key is split into one Parquet file per day, alongside a JSON manifest recording which time ranges of each key are covered, and the size and last access time of each partition
+#Only the sub-ranges missing from the cache are ever requested from InfluxDB, and only the partitions that overlap a request are read
+class InfluxCache(object):
+	"""
+	Member variables:
+
+	char *cacheDirectory;
+	int maxBytes;
+	bool refresh;
+	dict manifest;
+	threading.Lock lock;
+	dict partitionLocks;
+	threading.Lock manifestFileLock;
+	int manifestVersion;
+	int savedManifestVersion;
+	"""
+
+	MANIFEST_FILENAME: str = "manifest.json"
+	#Data newer than this is never cached, as it might still be changing
+	IMMUTABLE_AGE_SECONDS: float = 3600.0
+	#Length of the time range held by each partition. Partition n holds the rows timestamped in (n * PARTITION_SECONDS, (n + 1) * PARTITION_SECONDS], matching the (start, stop] semantics of a query
+	PARTITION_SECONDS: int = 86400
+
+	def __init__(self, cacheDirectory: str = ".ed_cache", maxBytes: int = 1024 * 1024 * 1024, refresh: bool = False) -> None:
+		self.cacheDirectory: str = cacheDirectory
+		self.maxBytes: int = maxBytes
+		self.refresh: bool = refresh
+
+		os.makedirs(self.cacheDirectory, exist_ok=True)
+		self.manifest: dict = self.LoadManifest()
+		#Guards the manifest. It is only held briefly, and never while a file is read or written
+		self.lock: threading.Lock = threading.Lock()
+		#One lock per partition of each key, held by the fetches that read or write it
+		self.partitionLocks: Dict[Tuple[str, int], threading.Lock] = {}
+		#Serialises writes of the manifest file. Each change to the manifest gets a new version, so that a thread never overwrites a newer manifest with an older one
+		self.manifestFileLock: threading.Lock = threading.Lock()
+		self.manifestVersion: int = 0
+		self.savedManifestVersion: int = 0
+
+
+	def LoadManifest(self) -> dict:
+		manifestPath: str = os.path.join(self.cacheDirectory, self.MANIFEST_FILENAME)
+		if not os.path.isfile(manifestPath):
+			return {}
+		try:
+			with open(manifestPath, 'r', encoding="utf-8") as Reader:
+				manifest: dict = json.load(Reader)
+		except (OSError, ValueError):
+			print ("Warning: InfluxDB cache manifest is unreadable, starting with an empty cache", file=sys.stderr)
+			return {}
+
+		#Entries written before the cache was partitioned hold one file per key, which is removed rather than split up
+		for key in [key for key, entry in manifest.items() if "partitions" not in entry]:
+			filePath: str = os.path.join(self.cacheDirectory, manifest.pop(key).get("file", ""))
+			if os.path.isfile(filePath):
+				os.remove(filePath)
+		return manifest
+
+	#Writes the manifest to disk. Must be called without the lock held, which is only taken to copy the manifest
+	def SaveManifest(self) -> None:
+		with self.lock:
+			self.manifestVersion += 1
+			version: int = self.manifestVersion
+			manifestText: str = json.dumps(self.manifest, indent=1)
+
+		manifestPath: str = os.path.join(self.cacheDirectory, self.MANIFEST_FILENAME)
+		with self.manifestFileLock:
+			if version <= self.savedManifestVersion:
+				return
+			#Write to a temporary file first so that an interrupted run can't corrupt the manifest
+			with open(manifestPath + ".tmp", 'w', encoding="utf-8") as Writer:
+				Writer.write(manifestText)
+			os.replace(manifestPath + ".tmp", manifestPath)
+			self.savedManifestVersion = version
+
+
+	#Builds the manifest key and the prefix of the Parquet files for a query. Queries for different sets of channels are cached separately
+	@staticmethod
+	def MakeKey(bucket: str, standID: str, location: str, aggregationWindow: int, channels: List[str] = None) -> Tuple[str, str]:
+		key: str = f"{bucket}|{standID}|{location}|{aggregationWindow}s"
+		if channels:
+			key += "|" + ",".join(sorted(channels))
+		prefix: str = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+		return (key, prefix)
+
+	def PartitionPath(self, prefix: str, partition: int) -> str:
+		return os.path.join(self.cacheDirectory, "%s_%d.parquet" % (prefix, partition))
+
+	def PartitionLock(self, key: str, partition: int) -> threading.Lock:
+		with self.lock:
+			return self.partitionLocks.setdefault((key, partition), threading.Lock())
+
+	#Returns the partition of each row, given its "_time" column
+	@classmethod
+	def RowPartitions(cls, times: pd.Series) -> numpy.ndarray:
+		nanoseconds: numpy.ndarray = pd.DatetimeIndex(times).as_unit("ns").asi8
+		return (nanoseconds - 1) // (cls.PARTITION_SECONDS * 1000000000)
+
+
+	#Merges overlapping and adjacent intervals
+	@staticmethod
+	def MergeIntervals(intervals: List[List[int]]) -> List[List[int]]:
+		op: List[List[int]] = []
+		for start, stop in sorted(intervals):
+			if op and start <= op[-1][1]:
+				op[-1][1] = max(op[-1][1], stop)
+			else:
+				op.append([start, stop])
+		return op
+
+	#Returns the parts of [start, stop) that are not covered by the cached intervals
+	@staticmethod
+	def MissingRanges(intervals: List[List[int]], start: int, stop: int) -> List[Tuple[int, int]]:
+		missing: List[Tuple[int, int]] = []
+		cursor: int = start
+		for cachedStart, cachedStop in intervals:
+			if cachedStop <= cursor:
+				continue
+			if cachedStart >= stop:
+				break
+			if cachedStart > cursor:
+				missing.append((cursor, cachedStart))
+			cursor = max(cursor, cachedStop)
+		if cursor < stop:
+			missing.append((cursor, stop))
+		return missing
+
+	#Removes [start, stop) from the cached intervals
+	@staticmethod
+	def SubtractInterval(intervals: List[List[int]], start: int, stop: int) -> List[List[int]]:
+		op: List[List[int]] = []
+		for cachedStart, cachedStop in intervals:
+			if cachedStart < start:
+				op.append([cachedStart, min(cachedStop, start)])
+			if cachedStop > stop:
+				op.append([max(cachedStart, stop), cachedStop])
+		return op
+
+
+	#Returns the rows for [start, stop), using cached data wherever possible and calling fetchFunction(start, stop) for the rest
+	#Range boundaries are snapped outwards to the aggregation window, so that separately fetched sub-ranges line up with InfluxDB's aggregation windows
+	def Fetch(self, bucket: str, standID: str, location: str, aggregationWindow: int, startTime: int, stopTime: int, fetchFunction: Callable[[int, int], pd.DataFrame], channels: List[str] = None) -> pd.DataFrame:
+		#Data that may still be changing is fetched directly
+		if stopTime > time.time() - self.IMMUTABLE_AGE_SECONDS:
+			return fetchFunction(startTime, stopTime)
+
+		key, prefix = self.MakeKey(bucket, standID, location, aggregationWindow, channels)
+		alignedStart: int = int(math.floor(startTime / aggregationWindow) * aggregationWindow)
+		alignedStop: int = int(math.ceil(stopTime / aggregationWindow) * aggregationWindow)
+		partitions: range = range(alignedStart // self.PARTITION_SECONDS, -(-alignedStop // self.PARTITION_SECONDS))
+
+		#The partitions that overlap the request are locked, in order, for the whole fetch, so that they can't be evicted or written by another thread in the meantime
+		#The manifest lock is only taken to read and update the manifest, so that experiments on other days or stands are fetched and read at the same time
+		with ExitStack() as heldLocks:
+			for partition in partitions:
+				heldLocks.enter_context(self.PartitionLock(key, partition))
+
+			with self.lock:
+				entry: dict = self.manifest.setdefault(key, {"prefix" : prefix, "intervals" : [], "partitions" : {}})
+				if self.refresh:
+					missing: List[Tuple[int, int]] = [(alignedStart, alignedStop)]
+				else:
+					missing = self.MissingRanges(entry["intervals"], alignedStart, alignedStop)
+
+			fetchedFrames: List[pd.DataFrame] = [fetchFunction(rangeStart, rangeStop) for rangeStart, rangeStop in missing]
+			fetchedFrames = [frame for frame in fetchedFrames if not frame.empty]
+			fetchedData: pd.DataFrame = pd.concat(fetchedFrames, ignore_index=True) if fetchedFrames else pd.DataFrame()
+			fetchedPartitions: numpy.ndarray = self.RowPartitions(fetchedData["_time"]) if fetchedFrames else numpy.empty(0, dtype=numpy.int64)
+
+			partitionFrames: List[pd.DataFrame] = []
+			writtenBytes: Dict[int, int] = {}
+			for partition in partitions:
+				filePath: str = self.PartitionPath(prefix, partition)
+				partitionData: pd.DataFrame = pd.read_parquet(filePath) if os.path.isfile(filePath) else pd.DataFrame()
+				newRows: numpy.ndarray = fetchedPartitions == partition
+				if newRows.any():
+					#Freshly fetched rows take precedence over cached ones
+					partitionData = pd.concat([fetchedData[newRows], partitionData], ignore_index=True)
+					partitionData = partitionData.drop_duplicates(subset="_time", keep="first").sort_values("_time", ignore_index=True)
+					partitionData.to_parquet(filePath + ".tmp", index=False)
+					os.replace(filePath + ".tmp", filePath)
+					writtenBytes[partition] = os.path.getsize(filePath)
+				if not partitionData.empty:
+					partitionFrames.append(partitionData)
+
+			with self.lock:
+				if missing:
+					entry["intervals"] = self.MergeIntervals(entry["intervals"] + [list(rangeBounds) for rangeBounds in missing])
+				accessTime: float = time.time()
+				for partition, byteCount in writtenBytes.items():
+					entry["partitions"][str(partition)] = {"bytes" : byteCount, "lastAccess" : accessTime}
+				for partition in partitions:
+					if str(partition) in entry["partitions"]:
+						entry["partitions"][str(partition)]["lastAccess"] = accessTime
+				evictedPartitions: List[Tuple[threading.Lock, str]] = self.Evict()
+
+			#Evicted files are deleted once the lock is released. Their partition locks are held until then, so that no fetch can write them in the meantime
+			for partitionLock, filePath in evictedPartitions:
+				heldLocks.callback(partitionLock.release)
+			for partitionLock, filePath in evictedPartitions:
+				if os.path.isfile(filePath):
+					os.remove(filePath)
+			self.SaveManifest()
+
+		if not partitionFrames:
+			return pd.DataFrame()
+		cachedData: pd.DataFrame = pd.concat(partitionFrames, ignore_index=True)
+
+		#Rows are timestamped at the end of their aggregation window, so the requested range is (start, stop]
+		startTimestamp: pd.Timestamp = pd.Timestamp(startTime, unit="s", tz="UTC")
+		stopTimestamp: pd.Timestamp = pd.Timestamp(stopTime, unit="s", tz="UTC")
+		inRange = (cachedData["_time"] > startTimestamp) & (cachedData["_time"] <= stopTimestamp)
+		return cachedData[inRange].reset_index(drop=True)
+
+
+	#Removes the least recently used partitions of any key, including the one being fetched, from the manifest until the cache fits in maxBytes. Must be called with the lock held
+	#Partitions that are locked by a fetch in progress are skipped. The time range of each removed partition is removed from its key's intervals, so that it is fetched again when it's next needed
+	#Returns the lock and file of each removed partition. The locks are left acquired, and the caller deletes the files and then releases the locks, outside of the lock
+	def Evict(self) -> List[Tuple[threading.Lock, str]]:
+		partitions: List[Tuple[float, str, str]] = [(partitionEntry["lastAccess"], key, partition) for key, entry in self.manifest.items() for partition, partitionEntry in entry["partitions"].items()]
+		totalBytes: int = sum(self.manifest[key]["partitions"][partition]["bytes"] for lastAccess, key, partition in partitions)
+		op: List[Tuple[threading.Lock, str]] = []
+		for lastAccess, key, partition in sorted(partitions):
+			if totalBytes <= self.maxBytes:
+				break
+			partitionLock: threading.Lock = self.partitionLocks.setdefault((key, int(partition)), threading.Lock())
+			if not partitionLock.acquire(blocking=False):
+				continue
+			entry: dict = self.manifest[key]
+			totalBytes -= entry["partitions"].pop(partition)["bytes"]
+			entry["intervals"] = self.SubtractInterval(entry["intervals"], int(partition) * self.PARTITION_SECONDS, (int(partition) + 1) * self.PARTITION_SECONDS)
+			op.append((partitionLock, self.PartitionPath(entry["prefix"], int(partition))))
+		return op
@@ -1,44 +1,105 @@
 #Import packages from pip
 from typing import Type
-import pandas as pd
 import sys
 import argparse
 
 #Import project files
-from ed_analysis_manager import EDAnalysisManager
+#ed_analysis_manager is imported once the arguments are parsed, as it pulls in pandas, plotly and the database clients, which --help and --config-gen don't need
 import config_manager
+from profiling import PROFILER
 
 #Configure argparse for handling command line arguments
 parser: argparse.ArgumentParser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 parser.add_argument("experimentIDs", action="store", help="List of experiment IDs to include", nargs='*')
 parser.add_argument("-o", "--output", action="store", help="Specify the name of the output file. Default is out.html")
+parser.add_argument("--plotlyjs", action="store", choices=["inline", "cdn"], help="Specify whether plotly.js is embedded in the output file (works offline), or loaded from a CDN (much smaller file). Default is inline")
+parser.add_argument("--parallel-render", action="store_true", help="Render the figures in parallel processes. Useful when many experiments are plotted")
+parser.add_argument("--timeseries", action="store_true", help="Add a figure of the current, voltage, CO2 and pH of each experiment to the report, with the data window of each current density step shaded. Experiments are always fetched, rather than reusing stored results")
+parser.add_argument("--max-points", action="store", help="Specify the largest number of points drawn for each channel of each time series figure. Traces are downsampled with the Largest-Triangle-Three-Buckets algorithm, which keeps their peaks and steps. Default is 2000")
+parser.add_argument("--metrics-out", action="store", help="Also write the table of processed metrics to a .parquet or .arrow file")
 parser.add_argument("-d", "--dashboard", action="store", help="Specify the ID of the Notion dashboard to read from")
 parser.add_argument("-x", "--exclude", action="store_true", help="Processes all experiments marked as \"Completed\", excluding those supplied as positional arguments")
+parser.add_argument("--since", action="store", help="Only include experiments that started on or after the given date, e.g. 2024-07-01, or date and time, e.g. \"2024-07-01 09:30\". Times without a time zone are in local time")
+parser.add_argument("--until", action="store", help="Only include experiments that started before the given date, or date and time")
+parser.add_argument("--match", action="store", help="Only include experiments whose labels match the given pattern, in which * matches any text and ? any character, e.g. \"Amine*\". Matching is case sensitive")
+parser.add_argument("--on-stand", action="store", help="Only include experiments run on the given stand, e.g. ED002")
 #parser.add_argument("-i", "--id-file", action="store", help="Pass the name of a file containing experiment IDs, each on a new line")
 parser.add_argument("--config-gen", action="store_true", help="Generate a config file named ed_data_analysis.conf with all options set to their defaults")
+parser.add_argument("--source", action="store", choices=["live", "replay"], help="Read experiment metadata and sensor data from Notion and InfluxDB (live), or from recordings in --replay-dir (replay). Default is live")
+parser.add_argument("--replay-dir", action="store", help="Specify the directory of recorded data used by --source replay. It must contain a dashboard.parquet or dashboard.csv file, plus .parquet or .csv files of sensor data")
+parser.add_argument("--location", action="store", help="Specify the location of experiments that have no \"Location\" in the dashboard. Default is arches")
+parser.add_argument("--stand", action="store", help="Specify the stand ID of experiments that have no \"Stand\" in the dashboard. Default is ED002")
+parser.add_argument("--facet-by-stand", action="store_true", help="Draw the results of each stand in a separate panel of each figure")
+parser.add_argument("--record", action="store", help="Save a copy of the dashboard and all sensor data fetched during this run into the given directory, so that it can be replayed later")
+parser.add_argument("--refresh", action="store_true", help="Ignore the local caches of InfluxDB data and the Notion dashboard, and the stored results of previous runs, and fetch and process everything again. Fetched data and results are still written to the caches")
+parser.add_argument("--cache-dir", action="store", help="Specify the directory used to cache InfluxDB data. Default is .ed_cache")
+parser.add_argument("--cache-size", action="store", help="Specify the maximum size of the InfluxDB cache in MB. Least recently used data is evicted beyond this. Default is 1024")
+parser.add_argument("--notion-ttl", action="store", help="Specify how many seconds the local snapshot of the Notion dashboard is used for before it is synced. Default is 300")
+parser.add_argument("--results-dir", action="store", help="Specify the directory where the processed metrics of each experiment are stored, so that unchanged experiments are not processed again. Default is results in the cache directory. With --source replay, results are only stored if this is given")
+parser.add_argument("-j", "--jobs", action="store", help="Specify the number of experiments fetched from InfluxDB concurrently. Default is 4")
+parser.add_argument("--batch-gap", action="store", help="Specify the largest gap in seconds between experiments on the same stand that are fetched in one query. Default is 600")
+parser.add_argument("--batch-span", action="store", help="Specify the longest time span in hours that one query may cover when fetching several experiments at once. 0 fetches each experiment separately. Default is 24")
+parser.add_argument("--batch-rows", action="store", help="Specify the largest number of rows that one query may return when fetching several experiments at once. Default is 20000")
+parser.add_argument("--processes", action="store", help="Specify the number of worker processes that step detection and the key metrics are calculated in, which helps when many experiments are processed. Fetched data is passed to them through shared memory. Not used with --stream or --pushdown. Default is 0 (calculated in the main process)")
+parser.add_argument("--stream", action="store_true", help="Fetch and process each experiment in time chunks, so that memory use is bounded by --memory-budget rather than the length of the experiment. Bypasses the InfluxDB cache")
+parser.add_argument("--memory-budget", action="store", help="Specify the approximate memory budget in MB for each chunk in streaming mode. Default is 256")
+parser.add_argument("--pushdown", action="store_true", help="Have InfluxDB calculate the statistics of each data window, so only the current and a few rows per window are downloaded rather than every row of each experiment. Takes precedence over --stream")
+parser.add_argument("--watch", action="store", help="Follow the running experiment with the given ID, analysing each current density step as it ends and rewriting the report, until the experiment's end time passes or Ctrl+C is pressed")
+parser.add_argument("--poll-interval", action="store", help="Specify how often in seconds new data is fetched in watch mode. Default is 10")
+parser.add_argument("--profile", action="store", nargs='?', const="profile.json", help="Record the wall time, rows, bytes and peak memory of each stage for each experiment. Writes a trace to the given .json or .csv file (profile.json if no file is given) and prints a summary")
+parser.add_argument("--job-file", action="store", help="Write several reports in one run, as described by the given job file. The experiments of all of the reports are fetched and processed once, sharing the dashboard, the InfluxDB client and the caches")
 parser.add_argument("-c", "--config", action="store", help="Specify the name of a config file from which configuration options will be loaded. Options set in this file will always be overridden by command line arguments")
 
-#Actually parse command line arguments and convert from argparse.Namespace to dict
-config: dict = vars(parser.parse_args())
+#Worker processes (of --processes and --parallel-render) import this module again when they are started with the spawn method, e.g. on macOS and Windows, so the CLI must only run in the main process
+if __name__ == "__main__":
+	#Actually parse command line arguments and convert from argparse.Namespace to dict
+	config: dict = vars(parser.parse_args())
 
-#If the --config-gen flag is set, create the config file and exit
-if config["config_gen"]:
-	config_manager.ConfigGen()
-	sys.exit(0)
+	#If the --config-gen flag is set, create the config file and exit
+	if config["config_gen"]:
+		config_manager.ConfigGen()
+		sys.exit(0)
 
-#If the --config flag is set, load config options from the file
-if config["config"]:
-	config_manager.LoadConfig(config)
+	#If the --config flag is set, load config options from the file
+	if config["config"]:
+		config_manager.LoadConfig(config)
 
+	#If the --job-file flag is set, load the options of each report from it
+	reports: list = None
+	if config["job_file"]:
+		try:
+			reports = config_manager.LoadJobFile(config, {key : parser.get_default(key) for key in config})
+		except Exception as e:
+			print (e, file=sys.stderr)
+			sys.exit(1)
 
-try:
-	edAnalysis = EDAnalysisManager(config)
-except Exception as e:
-	print (e, file=sys.stderr)
-	sys.exit(1)
+	#Writes the profiling trace and summary, if --profile is set
+	def ReportProfile() -> None:
+		if config["profile"]:
+			PROFILER.WriteTrace(config["profile"])
+			PROFILER.PrintSummary()
 
-try:
-	edAnalysis.PlotData()
-except Exception as e:
-	print (e, file=sys.stderr)
-	sys.exit(1)
+	if config["profile"]:
+		PROFILER.Enable()
+
+	try:
+		from ed_analysis_manager import EDAnalysisManager
+		edAnalysis = EDAnalysisManager(config, reports)
+	except Exception as e:
+		print (e, file=sys.stderr)
+		ReportProfile()
+		sys.exit(1)
+
+	try:
+		if reports:
+			failedReports: int = edAnalysis.WriteReports()
+			if failedReports:
+				raise Exception("Error: %d of %d reports could not be written" % (failedReports, len(reports)))
+		else:
+			edAnalysis.PlotData()
+	except Exception as e:
+		print (e, file=sys.stderr)
+		ReportProfile()
+		sys.exit(1)
+
+	ReportProfile()
@@ -0,0 +1,163 @@
+from typing import List, Dict
+import numpy
+import pandas as pd
+import os
+
+#Columnar store of the key metrics calculated for each data window
+#Each metric is held in a typed, preallocated NumPy array, and labels and stands are stored as categorical codes
+class MetricsStore(object):
+	"""
+	Member variables:
+
+	int size;
+	dict columns;
+	dict categories;
+	"""
+
+	FLOAT_COLUMNS: List[str] = [
+		"currentDensityActual",
+		"stackResistance",
+		"stackResistanceError",
+		"currentEfficiency",
+		"currentEfficiencyError",
+		"powerConsumption",
+		"powerConsumptionError",
+		"fluxCO2",
+		"fluxCO2Error",
+		"capturepHStart",
+		"capturepHEnd"
+	]
+	INT_COLUMNS: List[str] = ["currentDensityCategorical"]
+	CATEGORICAL_COLUMNS: List[str] = ["label", "stand"]
+	#Order of columns in exported tables
+	COLUMN_ORDER: List[str] = [
+		"currentDensityActual",
+		"currentDensityCategorical",
+		"stackResistance",
+		"stackResistanceError",
+		"currentEfficiency",
+		"currentEfficiencyError",
+		"powerConsumption",
+		"powerConsumptionError",
+		"fluxCO2",
+		"fluxCO2Error",
+		"label",
+		"stand",
+		"capturepHStart",
+		"capturepHEnd"
+	]
+
+	def __init__(self, capacity: int = 0) -> None:
+		self.size: int = 0
+		self.columns: Dict[str, numpy.ndarray] = {}
+		for column in self.FLOAT_COLUMNS:
+			self.columns[column] = numpy.empty(capacity, dtype=numpy.float64)
+		for column in self.INT_COLUMNS:
+			self.columns[column] = numpy.empty(capacity, dtype=numpy.int64)
+		#Categorical columns hold int32 codes into the list of categories of that column
+		self.categories: Dict[str, List[str]] = {}
+		for column in self.CATEGORICAL_COLUMNS:
+			self.columns[column] = numpy.empty(capacity, dtype=numpy.int32)
+			self.categories[column] = []
+
+	def __len__(self) -> int:
+		return self.size
+
+
+	#Makes sure there is room for at least `capacity` rows, so that appends don't need to reallocate
+	def Reserve(self, capacity: int) -> None:
+		currentCapacity: int = self.columns["label"].size
+		if capacity <= currentCapacity:
+			return
+		for column, values in self.columns.items():
+			grown: numpy.ndarray = numpy.empty(capacity, dtype=values.dtype)
+			grown[:self.size] = values[:self.size]
+			self.columns[column] = grown
+
+	#Returns the categorical code of a value of a categorical column, adding it to the categories if it's new
+	def CategoryCode(self, column: str, value: str) -> int:
+		if value not in self.categories[column]:
+			self.categories[column].append(value)
+		return self.categories[column].index(value)
+
+	#Adds a row of metrics. row must contain a value for every column
+	def Append(self, row: dict) -> None:
+		if self.size >= self.columns["label"].size:
+			#Grow geometrically if the store wasn't preallocated to the right size
+			self.Reserve(max(self.size * 2, 8))
+		for column in self.FLOAT_COLUMNS + self.INT_COLUMNS:
+			self.columns[column][self.size] = row[column]
+		for column in self.CATEGORICAL_COLUMNS:
+			self.columns[column][self.size] = self.CategoryCode(column, row[column])
+		self.size += 1
+
+	#Adds several rows of metrics at once. columns must contain an array for every float and int column, and categories the value of each categorical column, which is shared by all of the rows
+	def Extend(self, columns: Dict[str, numpy.ndarray], categories: Dict[str, str]) -> None:
+		count: int = len(columns[self.FLOAT_COLUMNS[0]])
+		if self.size + count > self.columns["label"].size:
+			self.Reserve(max(self.size * 2, self.size + count))
+		for column in self.FLOAT_COLUMNS + self.INT_COLUMNS:
+			self.columns[column][self.size:self.size + count] = columns[column]
+		for column in self.CATEGORICAL_COLUMNS:
+			self.columns[column][self.size:self.size + count] = self.CategoryCode(column, categories[column])
+		self.size += count
+
+
+	def ToDataFrame(self) -> pd.DataFrame:
+		return self.Concatenate([self])
+
+	#Combines several stores into one DataFrame in a single operation
+	@staticmethod
+	def Concatenate(stores: List["MetricsStore"]) -> pd.DataFrame:
+		data: dict = {}
+		for column in MetricsStore.COLUMN_ORDER:
+			if column in MetricsStore.CATEGORICAL_COLUMNS:
+				#Build a shared list of categories, and remap each store's codes onto it
+				categories: List[str] = []
+				codes: List[numpy.ndarray] = []
+				for store in stores:
+					remap: numpy.ndarray = numpy.empty(len(store.categories[column]), dtype=numpy.int32)
+					for n in range(0, len(store.categories[column])):
+						if store.categories[column][n] not in categories:
+							categories.append(store.categories[column][n])
+						remap[n] = categories.index(store.categories[column][n])
+					codes.append(remap[store.columns[column][:store.size]])
+				data[column] = pd.Categorical.from_codes(numpy.concatenate(codes) if codes else numpy.empty(0, dtype=numpy.int32), categories=categories)
+			else:
+				data[column] = numpy.concatenate([store.columns[column][:store.size] for store in stores]) if stores else numpy.empty(0)
+		return pd.DataFrame(data)
+
+	#Builds a store from a DataFrame with the same columns, e.g. one loaded from an exported file
+	@classmethod
+	def FromDataFrame(cls, frame: pd.DataFrame) -> "MetricsStore":
+		store: MetricsStore = cls(frame.shape[0])
+		for column in cls.FLOAT_COLUMNS + cls.INT_COLUMNS:
+			store.columns[column][:] = frame[column].to_numpy()
+		for column in cls.CATEGORICAL_COLUMNS:
+			values: pd.Categorical = pd.Categorical(frame[column])
+			store.categories[column] = [str(category) for category in values.categories]
+			store.columns[column][:] = values.codes
+		store.size = frame.shape[0]
+		return store
+
+
+	#Writes a table of metrics to a Parquet (.parquet) or Arrow IPC (.arrow, .feather) file
+	@staticmethod
+	def Save(frame: pd.DataFrame, filename: str) -> None:
+		extension: str = os.path.splitext(filename)[1].lower()
+		if extension in (".arrow", ".feather"):
+			frame.to_feather(filename)
+		elif extension == ".parquet":
+			frame.to_parquet(filename, index=False)
+		else:
+			raise Exception("Error: metrics can only be written to .parquet, .arrow or .feather files, not \"%s\"" % filename)
+
+	#Reads a table of metrics written by Save()
+	@classmethod
+	def Load(cls, filename: str) -> "MetricsStore":
+		extension: str = os.path.splitext(filename)[1].lower()
+		if extension in (".arrow", ".feather"):
+			return cls.FromDataFrame(pd.read_feather(filename))
+		elif extension == ".parquet":
+			return cls.FromDataFrame(pd.read_parquet(filename))
+		raise Exception("Error: metrics can only be read from .parquet, .arrow or .feather files, not \"%s\"" % filename)
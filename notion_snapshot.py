@@ -0,0 +1,111 @@
+from typing import List, Optional
+import pandas as pd
+from datetime import datetime, timedelta, timezone
+import json
+import os
+import sys
+
+#Local snapshot of the Notion dashboard, stored as the raw page objects returned by the Notion API
+#When the snapshot is older than its TTL, only pages edited since the last sync are downloaded and merged into it
+#notion_client and notion_df are only imported when they are used, as they are slow to import and not needed when replaying recorded data
+class NotionSnapshot(object):
+	"""
+	Member variables:
+
+	char *databaseID;
+	char *apiKey;
+	char *snapshotPath;
+	float ttl;
+	bool refresh;
+	"""
+
+	NOTION_PAGE_SIZE: int = 100
+	#Notion only reports last edited times to the minute, so syncs overlap by this much to avoid missing edits
+	SYNC_OVERLAP: timedelta = timedelta(minutes=2)
+
+	def __init__(self, databaseID: str, apiKey: str, snapshotDirectory: str = ".ed_cache", ttl: float = 300.0, refresh: bool = False) -> None:
+		self.databaseID: str = databaseID
+		self.apiKey: str = apiKey
+		self.ttl: float = ttl #s
+		self.refresh: bool = refresh
+
+		os.makedirs(snapshotDirectory, exist_ok=True)
+		self.snapshotPath: str = os.path.join(snapshotDirectory, "notion_%s.json" % databaseID.replace("-", ""))
+
+
+	def LoadSnapshot(self) -> Optional[dict]:
+		if not os.path.isfile(self.snapshotPath):
+			return None
+		try:
+			with open(self.snapshotPath, 'r', encoding="utf-8") as Reader:
+				return json.load(Reader)
+		except (OSError, ValueError):
+			print ("Warning: Notion dashboard snapshot is unreadable and will be downloaded again", file=sys.stderr)
+			return None
+
+	def SaveSnapshot(self, snapshot: dict) -> None:
+		#Write to a temporary file first so that an interrupted run can't corrupt the snapshot
+		with open(self.snapshotPath + ".tmp", 'w', encoding="utf-8") as Writer:
+			json.dump(snapshot, Writer)
+		os.replace(self.snapshotPath + ".tmp", self.snapshotPath)
+
+
+	#Queries every page of the database, optionally only those edited on or after a given time
+	def QueryPages(self, client: "Client", editedSince: Optional[datetime] = None) -> List[dict]:
+		queryArguments: dict = {"database_id" : self.databaseID, "page_size" : self.NOTION_PAGE_SIZE}
+		if editedSince is not None:
+			queryArguments["filter"] = {"timestamp" : "last_edited_time", "last_edited_time" : {"on_or_after" : editedSince.isoformat()}}
+
+		pages: List[dict] = []
+		queryResults: dict = client.databases.query(**queryArguments)
+		pages.extend(queryResults["results"])
+		while queryResults["has_more"]:
+			queryResults = client.databases.query(start_cursor=queryResults["next_cursor"], **queryArguments)
+			pages.extend(queryResults["results"])
+		return pages
+
+
+	#Brings the snapshot up to date with Notion. A full download is only done if there is no snapshot yet, or a refresh was requested
+	def Sync(self, snapshot: Optional[dict]) -> dict:
+		from notion_client import Client
+		syncStart: datetime = datetime.now(timezone.utc)
+		client: Client = Client(auth=self.apiKey)
+		try:
+			schema: dict = client.databases.retrieve(database_id=self.databaseID)["properties"]
+			if snapshot is None or self.refresh:
+				pages: List[dict] = self.QueryPages(client)
+			else:
+				lastSync: datetime = datetime.fromisoformat(snapshot["syncedAt"])
+				#Replace edited pages and append new ones, preserving the order of the existing pages
+				pagesByID: dict = {page["id"] : page for page in snapshot["pages"]}
+				for page in self.QueryPages(client, lastSync - self.SYNC_OVERLAP):
+					pagesByID[page["id"]] = page
+				pages = list(pagesByID.values())
+		finally:
+			client.close()
+
+		return {"syncedAt" : syncStart.isoformat(), "schema" : schema, "pages" : pages}
+
+
+	#Returns the dashboard as a DataFrame, in the same format as notion_df.download()
+	#If Notion can't be reached, the last snapshot is used instead
+	def Load(self) -> pd.DataFrame:
+		snapshot: Optional[dict] = self.LoadSnapshot()
+
+		snapshotAge: float = float("inf")
+		if snapshot is not None:
+			snapshotAge = (datetime.now(timezone.utc) - datetime.fromisoformat(snapshot["syncedAt"])).total_seconds()
+
+		if self.refresh or snapshotAge > self.ttl:
+			try:
+				snapshot = self.Sync(snapshot)
+				self.SaveSnapshot(snapshot)
+			except Exception as e:
+				if snapshot is None:
+					raise
+				print ("Warning: could not sync the Notion dashboard (%s). Using the snapshot from %s" % (e, snapshot["syncedAt"]), file=sys.stderr)
+
+		from notion_df.agent import load_df_from_queries
+		from notion_df.configs import DatabaseSchema
+		schema: DatabaseSchema = DatabaseSchema.from_raw(snapshot["schema"])
+		return schema.create_df(load_df_from_queries(snapshot["pages"]))
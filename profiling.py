@@ -0,0 +1,170 @@
+from typing import List
+import csv
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+#Lightweight per-stage instrumentation, enabled by --profile
+#When disabled, Stage() returns a shared no-op object, so instrumented code pays for little more than a function call
+
+
+#Returned by Stage() when profiling is disabled
+class NullStage(object):
+	def __enter__(self) -> "NullStage":
+		return self
+
+	def __exit__(self, *exceptionInfo) -> None:
+		pass
+
+	def AddRows(self, rows: int) -> None:
+		pass
+
+	def AddBytes(self, byteCount: int) -> None:
+		pass
+
+NULL_STAGE: NullStage = NullStage()
+
+
+#Records one run of a stage: wall time, rows and bytes handled, and the peak traced memory while it ran
+class ProfileStage(object):
+	"""
+	Member variables:
+
+	Profiler profiler;
+	char *name;
+	char *experiment;
+	float startTime;
+	float wallTime;
+	int rows;
+	int bytes;
+	int peakMemory;
+	"""
+
+	def __init__(self, profiler: "Profiler", name: str, experiment: str) -> None:
+		self.profiler: Profiler = profiler
+		self.name: str = name
+		self.experiment: str = experiment
+		self.startTime: float = 0.0
+		self.wallTime: float = 0.0
+		self.rows: int = 0
+		self.bytes: int = 0
+		self.peakMemory: int = 0
+
+	def __enter__(self) -> "ProfileStage":
+		self.profiler.StageStarted()
+		self.startTime = time.perf_counter()
+		return self
+
+	def __exit__(self, *exceptionInfo) -> None:
+		self.wallTime = time.perf_counter() - self.startTime
+		self.peakMemory = self.profiler.StageFinished()
+		self.profiler.Record(self)
+
+	def AddRows(self, rows: int) -> None:
+		self.rows += rows
+
+	def AddBytes(self, byteCount: int) -> None:
+		self.bytes += byteCount
+
+	def ToDict(self) -> dict:
+		return {
+			"stage" : self.name,
+			"experiment" : self.experiment,
+			"start" : self.startTime - self.profiler.startTime,
+			"wallTime" : self.wallTime,
+			"rows" : self.rows,
+			"bytes" : self.bytes,
+			"peakMemory" : self.peakMemory
+		}
+
+
+class Profiler(object):
+	"""
+	Member variables:
+
+	bool enabled;
+	float startTime;
+	ProfileStage *stages;
+	int activeStages;
+	threading.Lock lock;
+	"""
+
+	def __init__(self) -> None:
+		self.enabled: bool = False
+		self.startTime: float = time.perf_counter()
+		self.stages: List[ProfileStage] = []
+		self.activeStages: int = 0
+		self.lock: threading.Lock = threading.Lock()
+
+	#Starts recording. Memory is traced with tracemalloc, which slows Python code down, so it is only started here
+	def Enable(self) -> None:
+		self.enabled = True
+		self.startTime = time.perf_counter()
+		if not tracemalloc.is_tracing():
+			tracemalloc.start()
+
+	#Stops recording, e.g. in worker processes, whose stages would be lost anyway
+	def Disable(self) -> None:
+		self.enabled = False
+		if tracemalloc.is_tracing():
+			tracemalloc.stop()
+
+	#Use as: with PROFILER.Stage("name", exp.label) as stage: ...
+	def Stage(self, name: str, experiment: str = ""):
+		if not self.enabled:
+			return NULL_STAGE
+		return ProfileStage(self, name, experiment)
+
+
+	#The traced memory peak is reset when a stage starts with no other stages running
+	#Stages that overlap (nested, or on other threads) therefore report the peak of the whole process since the outermost one started
+	def StageStarted(self) -> None:
+		with self.lock:
+			if self.activeStages == 0:
+				tracemalloc.reset_peak()
+			self.activeStages += 1
+
+	def StageFinished(self) -> int:
+		with self.lock:
+			self.activeStages -= 1
+			return tracemalloc.get_traced_memory()[1]
+
+	def Record(self, stage: ProfileStage) -> None:
+		with self.lock:
+			self.stages.append(stage)
+
+
+	#Writes every recorded stage to a .csv file, or otherwise a JSON file
+	def WriteTrace(self, filename: str) -> None:
+		records: List[dict] = [stage.ToDict() for stage in sorted(self.stages, key=lambda stage: stage.startTime)]
+		if os.path.splitext(filename)[1].lower() == ".csv":
+			with open(filename, 'w', encoding="utf-8", newline="") as Writer:
+				writer: csv.DictWriter = csv.DictWriter(Writer, fieldnames=["stage", "experiment", "start", "wallTime", "rows", "bytes", "peakMemory"])
+				writer.writeheader()
+				writer.writerows(records)
+		else:
+			with open(filename, 'w', encoding="utf-8") as Writer:
+				json.dump({"totalWallTime" : time.perf_counter() - self.startTime, "stages" : records}, Writer, indent=1)
+
+	#Prints a table of totals per stage
+	def PrintSummary(self, file=sys.stderr) -> None:
+		totals: dict = {}
+		for stage in self.stages:
+			total: dict = totals.setdefault(stage.name, {"count" : 0, "wallTime" : 0.0, "rows" : 0, "bytes" : 0, "peakMemory" : 0})
+			total["count"] += 1
+			total["wallTime"] += stage.wallTime
+			total["rows"] += stage.rows
+			total["bytes"] += stage.bytes
+			total["peakMemory"] = max(total["peakMemory"], stage.peakMemory)
+
+		print ("%-20s %6s %12s %12s %12s %14s" % ("Stage", "Count", "Wall time/s", "Rows", "Bytes/MB", "Peak mem/MB"), file=file)
+		for name, total in totals.items():
+			print ("%-20s %6d %12.3f %12d %12.2f %14.2f" % (name, total["count"], total["wallTime"], total["rows"], total["bytes"] / 1048576.0, total["peakMemory"] / 1048576.0), file=file)
+		print ("Total wall time: %.3f s (stages can overlap, as experiments are fetched concurrently)" % (time.perf_counter() - self.startTime), file=file)
+
+
+#Shared by the whole program
+PROFILER: Profiler = Profiler()
@@ -0,0 +1,86 @@
+from typing import List, Dict
+import numpy
+import pandas as pd
+import threading
+
+#Import project files
+from experiment_meta import ExperimentMeta
+from data_sources import SensorDataSource
+from window_index import SortedTimes
+
+#Plans the sensor data queries for a run, so that experiments which overlap or lie close together in time on the same stand are fetched in one query
+#Each query is split back into the rows of each of its experiments, with the same (start, stop] semantics as a query per experiment
+
+
+#One query, covering one or more experiments on the same stand
+class QueryBatch(object):
+	"""
+	Member variables:
+
+	char *location;
+	char *standID;
+	int startTime;
+	int stopTime;
+	ExperimentMeta *experiments;
+	pd.DataFrame rawData;
+	numpy.ndarray times;
+	int remaining;
+	threading.Lock lock;
+	"""
+
+	def __init__(self, exp: ExperimentMeta) -> None:
+		self.location: str = exp.location
+		self.standID: str = exp.standID
+		self.startTime: int = int(exp.startTime)
+		self.stopTime: int = int(exp.stopTime)
+		self.experiments: List[ExperimentMeta] = [exp]
+		self.rawData: pd.DataFrame = None
+		self.times: numpy.ndarray = None
+		#Number of experiments that haven't taken their rows yet. The batch's data is released once this reaches 0
+		self.remaining: int = 1
+		#Held while the batch is fetched, so that it is only queried once however many threads need it
+		self.lock: threading.Lock = threading.Lock()
+
+	def Add(self, exp: ExperimentMeta) -> None:
+		self.experiments.append(exp)
+		self.startTime = min(self.startTime, int(exp.startTime))
+		self.stopTime = max(self.stopTime, int(exp.stopTime))
+		self.remaining += 1
+
+	#Fetches the batch on first use, and returns the rows of one of its experiments
+	def Slice(self, exp: ExperimentMeta, sensorSource: SensorDataSource) -> pd.DataFrame:
+		with self.lock:
+			if self.rawData is None:
+				self.rawData, self.times = SortedTimes(sensorSource.Query(self.startTime, self.stopTime))
+
+			first: int = int(numpy.searchsorted(self.times, int(exp.startTime) * 1000000000, side="right"))
+			last: int = int(numpy.searchsorted(self.times, int(exp.stopTime) * 1000000000, side="right"))
+			rawData: pd.DataFrame = self.rawData.iloc[first:last].reset_index(drop=True)
+
+			self.remaining -= 1
+			if self.remaining == 0:
+				self.rawData = None
+				self.times = None
+		return rawData
+
+
+#Groups experiments by stand, and merges those that overlap or are separated by at most maxGap seconds into batches
+#A batch is not grown beyond maxSpan seconds or an estimated maxRows rows, although an experiment longer than that still gets a batch of its own
+def PlanQueries(experiments: List[ExperimentMeta], aggregationWindow: int, maxGap: float, maxSpan: float, maxRows: int) -> List[QueryBatch]:
+	stands: Dict[tuple, List[ExperimentMeta]] = {}
+	for exp in experiments:
+		stands.setdefault((exp.location, exp.standID), []).append(exp)
+
+	batches: List[QueryBatch] = []
+	for standExperiments in stands.values():
+		batch: QueryBatch = None
+		for exp in sorted(standExperiments, key=lambda exp: exp.startTime):
+			if batch is not None:
+				stopTime: int = max(batch.stopTime, int(exp.stopTime))
+				span: int = stopTime - batch.startTime
+				if int(exp.startTime) - batch.stopTime <= maxGap and span <= maxSpan and span / aggregationWindow <= maxRows:
+					batch.Add(exp)
+					continue
+			batch = QueryBatch(exp)
+			batches.append(batch)
+	return batches
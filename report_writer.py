@@ -0,0 +1,196 @@
+from typing import List, Iterator, Tuple
+import pandas as pd
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+#Import project files
+from downsampling import TRACE_CHANNELS
+
+#plotly is imported by the functions that use it, as it's slow to import and not needed until the report is written
+
+#Definitions of the bar charts drawn in the report, one per key metric
+FIGURE_SPECS: List[dict] = [
+	{"y" : "stackResistance", "error_y" : "stackResistanceError", "title" : "Stack resistance", "yaxis_title" : "Stack resistance / Ω"},
+	{"y" : "currentEfficiency", "error_y" : "currentEfficiencyError", "title" : "Current efficiency", "yaxis_title" : "Current efficiency / %"},
+	{"y" : "powerConsumption", "error_y" : "powerConsumptionError", "title" : "Power consumption", "yaxis_title" : "Power consumption / kWh t<sup>-1</sup> CO<sub>2</sub>"},
+	{"y" : "fluxCO2", "error_y" : "fluxCO2Error", "title" : "CO<sub>2</sub> flux", "yaxis_title" : "CO<sub>2</sub> flux / mg m<sup>-2</sup> s<sup>-1</sup>"}
+]
+
+#Labels shown in hover text instead of column names
+HOVER_LABELS: dict = {
+	"capturepHStart" : "Capture pH (start)",
+	"capturepHEnd" : "Capture pH (end)",
+	"stand" : "Stand"
+}
+
+#Axis titles of the panels of the time series figures
+TRACE_LABELS: dict = {
+	"current_PSU001" : "Current / A",
+	"voltage_PSU001" : "Voltage / V",
+	"CO2_PPM_CO2001" : "CO<sub>2</sub> / ppm",
+	"pH_PH002" : "pH"
+}
+
+PLOTLY_CDN_URL: str = "https://cdn.plot.ly/plotly-%s.min.js"
+
+
+#Draws one of the bar charts in FIGURE_SPECS. With facetByStand, each stand is drawn in its own panel
+def BuildBarFigure(allProcessedData: pd.DataFrame, spec: dict, facetByStand: bool = False):
+	import plotly.express as px
+	#pH is passed as two numeric columns, so it's sent as compact arrays rather than one string per bar
+	hoverData: dict = {"capturepHStart" : ":.2f", "capturepHEnd" : ":.2f"}
+	#The stand is a text column, which would turn every bar's hover data into a plain list, so it's only shown when it tells bars apart
+	if facetByStand or allProcessedData["stand"].nunique() > 1:
+		hoverData["stand"] = True
+	figure = px.bar(allProcessedData,
+		x="currentDensityCategorical",
+		y=spec["y"],
+		error_y=spec["error_y"],
+		color="label",
+		barmode="group",
+		hover_data=hoverData,
+		labels=HOVER_LABELS,
+		facet_col="stand" if facetByStand else None
+	)
+
+	figure.update_layout(
+		title=spec["title"],
+		legend_title="Amine"
+	)
+	#Faceted figures have one x axis per panel, but only the first panel needs a y axis title
+	figure.update_xaxes(title_text="Current density / A m<sup>-2</sup>")
+	figure.update_yaxes(title_text=spec["yaxis_title"], col=1)
+	return figure
+
+
+#Draws the downsampled sensor traces of one experiment, one channel per panel, with the data window of each current density step shaded
+#traces is a long frame as returned by DownsampleTraces(), and windowTimes holds the [start, stop] of each window in int64 nanoseconds
+def BuildTimeseriesFigure(label: str, traces: pd.DataFrame, windowTimes: List[Tuple[int, int]]):
+	import plotly.graph_objects as go
+	from plotly.subplots import make_subplots
+	channels: List[str] = [channel for channel in TRACE_CHANNELS if (traces["channel"] == channel).any()]
+	figure = make_subplots(rows=max(len(channels), 1), cols=1, shared_xaxes=True, vertical_spacing=0.02)
+	for n, channel in enumerate(channels):
+		channelTraces: pd.DataFrame = traces[traces["channel"] == channel]
+		#Times are drawn in UTC, without a time zone, which plotly.js doesn't understand
+		figure.add_trace(go.Scatter(x=channelTraces["_time"].dt.tz_convert(None), y=channelTraces["value"], mode="lines", name=TRACE_LABELS.get(channel, channel), showlegend=False), row=n + 1, col=1)
+		figure.update_yaxes(title_text=TRACE_LABELS.get(channel, channel), row=n + 1, col=1)
+
+	#One shape per window spans every panel, which is far cheaper to draw than one add_vrect() per window and panel
+	figure.update_layout(
+		title=label,
+		height=200 + 150 * len(channels),
+		shapes=[{"type" : "rect", "xref" : "x", "yref" : "paper", "x0" : pd.Timestamp(start, unit="ns"), "x1" : pd.Timestamp(stop, unit="ns"), "y0" : 0.0, "y1" : 1.0, "fillcolor" : "LightSalmon", "opacity" : 0.4, "layer" : "below", "line_width" : 0} for start, stop in windowTimes]
+	)
+	figure.update_xaxes(title_text="Time (UTC)", row=max(len(channels), 1), col=1)
+	return figure
+
+
+#Returns the HTML <div> for a figure, without plotly.js. Numeric arrays are base64-encoded by plotly and the JSON has no whitespace
+#Top-level function so that it can be run in worker processes
+def RenderFigure(figure, divID: str) -> str:
+	import plotly.io as pio
+	return pio.to_html(figure, include_plotlyjs=False, full_html=False, div_id=divID, validate=False)
+
+def RenderBarFigure(allProcessedData: pd.DataFrame, spec: dict, divID: str, facetByStand: bool = False) -> str:
+	return RenderFigure(BuildBarFigure(allProcessedData, spec, facetByStand), divID)
+
+def RenderTimeseriesFigure(label: str, traces: pd.DataFrame, windowTimes: List[Tuple[int, int]], divID: str) -> str:
+	return RenderFigure(BuildTimeseriesFigure(label, traces, windowTimes), divID)
+
+
+#Writes the HTML report. plotly.js is included exactly once, and figures are written to the file as soon as each one is rendered
+class ReportWriter(object):
+	"""
+	Member variables:
+
+	char *outputFilename;
+	char *plotlyJS;
+	bool parallel;
+	bool facetByStand;
+	"""
+
+	def __init__(self, outputFilename: str, plotlyJS: str = "inline", parallel: bool = False, facetByStand: bool = False) -> None:
+		self.outputFilename: str = outputFilename
+		#"inline" embeds plotly.js so the report works offline, "cdn" references it instead, which makes the file a few MB smaller
+		if plotlyJS not in ("inline", "cdn"):
+			raise Exception("Error: plotly.js can only be included \"inline\" or from a \"cdn\", not \"%s\"" % plotlyJS)
+		self.plotlyJS: str = plotlyJS
+		self.parallel: bool = parallel
+		self.facetByStand: bool = facetByStand
+
+	def PlotlyScript(self) -> str:
+		import plotly.offline
+		if self.plotlyJS == "cdn":
+			return "<script src=\"%s\" charset=\"utf-8\"></script>\n" % (PLOTLY_CDN_URL % plotly.offline.get_plotlyjs_version())
+		return "<script type=\"text/javascript\">%s</script>\n" % plotly.offline.get_plotlyjs()
+
+
+	#Renders the bar charts for every spec in FIGURE_SPECS, in order
+	#In parallel mode, figures are built and serialised in separate processes, which helps when many experiments are plotted
+	def RenderBarFigures(self, allProcessedData: pd.DataFrame) -> Iterator[str]:
+		divIDs: List[str] = ["ed-figure-%d" % n for n in range(0, len(FIGURE_SPECS))]
+		if not self.parallel:
+			for spec, divID in zip(FIGURE_SPECS, divIDs):
+				yield RenderBarFigure(allProcessedData, spec, divID, self.facetByStand)
+			return
+
+		with ProcessPoolExecutor(max_workers=len(FIGURE_SPECS)) as executor:
+			yield from executor.map(RenderBarFigure, [allProcessedData] * len(FIGURE_SPECS), FIGURE_SPECS, divIDs, [self.facetByStand] * len(FIGURE_SPECS))
+
+	#Renders a time series figure for each (label, traces, windowTimes) of experiments, in order
+	def RenderTimeseriesFigures(self, experiments: List[Tuple[str, pd.DataFrame, List[Tuple[int, int]]]]) -> Iterator[str]:
+		divIDs: List[str] = ["ed-timeseries-%d" % n for n in range(0, len(experiments))]
+		if not self.parallel:
+			for (label, traces, windowTimes), divID in zip(experiments, divIDs):
+				yield RenderTimeseriesFigure(label, traces, windowTimes, divID)
+			return
+
+		with ProcessPoolExecutor() as executor:
+			yield from executor.map(RenderTimeseriesFigure, [experiment[0] for experiment in experiments], [experiment[1] for experiment in experiments], [experiment[2] for experiment in experiments], divIDs)
+
+
+	#Writes each rendered figure into a grid with 2 figures per row, followed by each rendered time series figure at full width
+	#The report is written to a temporary file that then replaces the old report, so the report is never seen half written, e.g. when it's rewritten in watch mode
+	def Write(self, renderedFigures: Iterator[str], renderedTimeseries: Iterator[str] = ()) -> None:
+		with open(self.outputFilename + ".tmp", 'w', encoding="utf-8") as Writer:
+			Writer.write("""\
+<!DOCTYPE html>
+<html>
+<head>
+	<meta charset="utf-8">
+	<title>ED results</title>
+	<style>
+		.graph-column{
+			width: 45%;
+			float: left;
+			padding: 5px 12px 0px 0px;
+		}
+		.graph-row{
+			clear: both;
+		}
+	</style>
+""")
+			Writer.write(self.PlotlyScript())
+			Writer.write("</head>\n<body>\n")
+
+			n: int = 0
+			for renderedFigure in renderedFigures:
+				if n % 2 == 0:
+					Writer.write("\t<div class=\"graph-row\">\n")
+				Writer.write("<div class=\"graph-column\">\n")
+				Writer.write(renderedFigure)
+				Writer.write("</div>\n")
+				if n % 2 == 1:
+					Writer.write("\t</div>\n")
+				n += 1
+			if n % 2 == 1:
+				Writer.write("\t</div>\n")
+
+			for renderedFigure in renderedTimeseries:
+				Writer.write("\t<div class=\"graph-row\">\n")
+				Writer.write(renderedFigure)
+				Writer.write("\t</div>\n")
+
+			Writer.write("</body>\n</html>")
+		os.replace(self.outputFilename + ".tmp", self.outputFilename)
@@ -0,0 +1,113 @@
+from typing import List
+import pandas as pd
+import hashlib
+import json
+import os
+import sys
+import time
+
+#Import project files
+from experiment_meta import ExperimentMeta
+from metrics_store import MetricsStore
+
+#Bump this whenever a change to the analysis changes the metrics, so that stored results are recalculated
+RESULTS_VERSION: int = 3
+
+#On-disk store of the processed metrics of each experiment, so that finished experiments are only analysed once
+#Results are stored as one Parquet file per experiment ID, alongside a JSON manifest recording the stand, start and end times and the analysis parameters they were calculated with
+#Stored results are only used if all of these still match. Each experiment is saved as soon as it is processed, so an interrupted run resumes where it stopped
+class ResultsStore(object):
+	"""
+	Member variables:
+
+	char *resultsDirectory;
+	char *parametersHash;
+	bool refresh;
+	dict manifest;
+	"""
+
+	MANIFEST_FILENAME: str = "manifest.json"
+	#Experiments that ended more recently than this are not stored, as their data might still be changing
+	IMMUTABLE_AGE_SECONDS: float = 3600.0
+
+	def __init__(self, resultsDirectory: str, parameters: dict, refresh: bool = False) -> None:
+		self.resultsDirectory: str = resultsDirectory
+		self.parametersHash: str = self.HashParameters(parameters)
+		self.refresh: bool = refresh
+
+		os.makedirs(self.resultsDirectory, exist_ok=True)
+		self.manifest: dict = self.LoadManifest()
+
+
+	#Returns a hash of everything that the metrics depend on, apart from the sensor data itself
+	@staticmethod
+	def HashParameters(parameters: dict) -> str:
+		parameters = dict(parameters, resultsVersion=RESULTS_VERSION)
+		return hashlib.sha1(json.dumps(parameters, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+	def LoadManifest(self) -> dict:
+		manifestPath: str = os.path.join(self.resultsDirectory, self.MANIFEST_FILENAME)
+		if not os.path.isfile(manifestPath):
+			return {}
+		try:
+			with open(manifestPath, 'r', encoding="utf-8") as Reader:
+				return json.load(Reader)
+		except (OSError, ValueError):
+			print ("Warning: results manifest is unreadable, all experiments will be processed again", file=sys.stderr)
+			return {}
+
+	def SaveManifest(self) -> None:
+		manifestPath: str = os.path.join(self.resultsDirectory, self.MANIFEST_FILENAME)
+		#Write to a temporary file first so that an interrupted run can't corrupt the manifest
+		with open(manifestPath + ".tmp", 'w', encoding="utf-8") as Writer:
+			json.dump(self.manifest, Writer, indent=1)
+		os.replace(manifestPath + ".tmp", manifestPath)
+
+	@staticmethod
+	def MakeFilename(experimentID: str) -> str:
+		return hashlib.sha1(experimentID.encode("utf-8")).hexdigest()[:16] + ".parquet"
+
+
+	#Loads the stored metrics of an experiment into its processedData, if they are up to date. Returns whether they were
+	def Load(self, exp: ExperimentMeta) -> bool:
+		entry: dict = self.manifest.get(exp.experimentID)
+		if self.refresh or not exp.experimentID or entry is None:
+			return False
+		if entry["startTime"] != exp.startTime or entry["stopTime"] != exp.stopTime or entry.get("location") != exp.location or entry.get("standID") != exp.standID or entry["parametersHash"] != self.parametersHash:
+			return False
+
+		try:
+			processedData: MetricsStore = MetricsStore.Load(os.path.join(self.resultsDirectory, entry["filename"]))
+		except Exception as e:
+			print ("Warning: stored results for experiment \"%s\" could not be read, it will be processed again: %s" % (exp.experimentID, e), file=sys.stderr)
+			return False
+
+		#The label may have been edited in Notion since the results were stored
+		if len(processedData):
+			processedData.categories["label"] = [exp.label]
+		exp.processedData = processedData
+		return True
+
+	#Stores the metrics of a processed experiment and checkpoints the manifest
+	def Save(self, exp: ExperimentMeta) -> None:
+		if not exp.experimentID or exp.stopTime > time.time() - self.IMMUTABLE_AGE_SECONDS:
+			return
+
+		filename: str = self.MakeFilename(exp.experimentID)
+		temporaryPath: str = os.path.join(self.resultsDirectory, "tmp_" + filename)
+		MetricsStore.Save(exp.processedData.ToDataFrame(), temporaryPath)
+		os.replace(temporaryPath, os.path.join(self.resultsDirectory, filename))
+
+		self.manifest[exp.experimentID] = {
+			"startTime" : exp.startTime,
+			"stopTime" : exp.stopTime,
+			"location" : exp.location,
+			"standID" : exp.standID,
+			"parametersHash" : self.parametersHash,
+			"filename" : filename
+		}
+		self.SaveManifest()
+
+	#Loads the stored metrics of every experiment that has them, and returns the experiments that still need processing
+	def LoadAll(self, experiments: List[ExperimentMeta]) -> List[ExperimentMeta]:
+		return [exp for exp in experiments if not self.Load(exp)]
@@ -0,0 +1,93 @@
+from typing import Dict, Tuple
+import numpy
+import pandas as pd
+from multiprocessing import shared_memory
+
+#Hands DataFrames of sensor data to worker processes through shared memory, so that the rows are copied once rather than pickled and sent down a pipe
+#Only the "_time" column and numeric columns are shared, which is everything that the analysis uses
+class SharedFrame(object):
+	"""
+	Member variables:
+
+	char *name;
+	int rows;
+	dict columns;
+	char *timeZone;
+	shared_memory.SharedMemory sharedMemory;
+	"""
+
+	#Columns are laid out back to back in one block, each starting on an 8 byte boundary
+	ALIGNMENT: int = 8
+
+	def __init__(self, name: str, rows: int, columns: Dict[str, Tuple[int, str]], timeZone: str) -> None:
+		self.name: str = name
+		self.rows: int = rows
+		#Maps each column name to its byte offset in the block and its NumPy dtype
+		self.columns: Dict[str, Tuple[int, str]] = columns
+		self.timeZone: str = timeZone
+		#Only set in the process that created the block
+		self.sharedMemory: shared_memory.SharedMemory = None
+
+	#Copies the shareable columns of a DataFrame into a new block of shared memory. "_time" is stored as int64 nanoseconds
+	@classmethod
+	def FromDataFrame(cls, frame: pd.DataFrame) -> "SharedFrame":
+		arrays: Dict[str, numpy.ndarray] = {}
+		timeZone: str = None
+		if "_time" in frame.columns:
+			times: pd.DatetimeIndex = pd.DatetimeIndex(frame["_time"])
+			if times.tz is not None:
+				timeZone = str(times.tz)
+			arrays["_time"] = times.as_unit("ns").asi8
+		for column in frame.columns:
+			if column != "_time" and isinstance(frame[column].dtype, numpy.dtype) and frame[column].dtype.kind in "fiub":
+				arrays[column] = frame[column].to_numpy()
+
+		columns: Dict[str, Tuple[int, str]] = {}
+		size: int = 0
+		for column, values in arrays.items():
+			columns[column] = (size, values.dtype.str)
+			size += -(-values.nbytes // cls.ALIGNMENT) * cls.ALIGNMENT
+
+		#Blocks can't be empty
+		sharedMemory: shared_memory.SharedMemory = shared_memory.SharedMemory(create=True, size=max(size, cls.ALIGNMENT))
+		sharedFrame: SharedFrame = cls(sharedMemory.name, frame.shape[0], columns, timeZone)
+		sharedFrame.sharedMemory = sharedMemory
+		for column, values in arrays.items():
+			sharedFrame.View(sharedMemory, column)[:] = values
+		return sharedFrame
+
+	#The block itself is never pickled, only its name and layout
+	def __getstate__(self) -> dict:
+		state: dict = self.__dict__.copy()
+		state["sharedMemory"] = None
+		return state
+
+
+	def View(self, sharedMemory: shared_memory.SharedMemory, column: str) -> numpy.ndarray:
+		offset, dtype = self.columns[column]
+		return numpy.ndarray((self.rows,), dtype=numpy.dtype(dtype), buffer=sharedMemory.buf, offset=offset)
+
+	#Attaches to the block and copies it into a DataFrame owned by this process
+	def ToDataFrame(self) -> pd.DataFrame:
+		#Worker processes share the resource tracker of the process that created the block, so attaching doesn't make it unlink the block when a worker exits
+		sharedMemory: shared_memory.SharedMemory = shared_memory.SharedMemory(name=self.name)
+		try:
+			data: dict = {}
+			for column in self.columns:
+				values: numpy.ndarray = self.View(sharedMemory, column).copy()
+				if column == "_time":
+					data[column] = pd.to_datetime(values, unit="ns", utc=self.timeZone is not None)
+					if self.timeZone is not None:
+						data[column] = data[column].tz_convert(self.timeZone)
+				else:
+					data[column] = values
+		finally:
+			sharedMemory.close()
+		return pd.DataFrame(data)
+
+	#Frees the block. Called by the process that created it, once the workers are done with it
+	def Unlink(self) -> None:
+		if self.sharedMemory is not None:
+			self.sharedMemory.close()
+			self.sharedMemory.unlink()
+			self.sharedMemory = None
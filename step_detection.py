@@ -0,0 +1,92 @@
+from typing import List
+import numpy
+import pandas as pd
+
+#Default parameters of the step detection heuristic
+#Lots of magic numbers here, sorry :(
+#They gave good results for me, but feel free to play around with them if they aren't working out for you
+DEFAULT_ROLL: int = 5
+DEFAULT_PERCENT_TOLERANCE: float = 10.0
+ENDPOINT_OFFSET: int = 5
+
+
+#Returns a boolean array which is True wherever the current deviates from the rolling median by more than the tolerance
+#The rolling median and tolerance bands are computed once for the whole series
+def OutOfBandMask(currents: numpy.ndarray, roll: int = DEFAULT_ROLL, percentTolerance: float = DEFAULT_PERCENT_TOLERANCE) -> numpy.ndarray:
+	rollingMedian: numpy.ndarray = pd.Series(currents).rolling(roll).median().to_numpy()
+	upperBound: numpy.ndarray = rollingMedian * (1 + (percentTolerance/100.0))
+	lowerBound: numpy.ndarray = rollingMedian * (1 - (percentTolerance/100.0))
+	#Comparisons against NaN are False, so windows without a valid median never trigger a breakpoint
+	with numpy.errstate(invalid="ignore"):
+		return (currents > upperBound) | (currents < lowerBound)
+
+
+#Walks through the out-of-band positions, applying the skip-ahead rule: once a breakpoint is found at n, positions up to n + roll * 2 are ignored
+#Only the candidate positions are visited, so this is cheap even for very long experiments
+def SelectBreakpoints(outOfBand: numpy.ndarray, firstIndex: int, skip: int) -> List[int]:
+	candidates: numpy.ndarray = numpy.flatnonzero(outOfBand)
+	breakpoints: List[int] = []
+	nextAllowed: int = firstIndex
+	position: int = int(numpy.searchsorted(candidates, nextAllowed, side="left"))
+	while position < candidates.size:
+		n: int = int(candidates[position])
+		breakpoints.append(n)
+		nextAllowed = n + skip + 1
+		position = int(numpy.searchsorted(candidates, nextAllowed, side="left"))
+	return breakpoints
+
+
+#Logic to guess the timestamps for the last 5 minutes of each current density setting. Based on deviation of current reading from a rolling median
+#Returns positional indices of the last row of each current density step, followed by the index used for the endpoint of the experiment
+def DetectSteps(currents: pd.Series, roll: int = DEFAULT_ROLL, percentTolerance: float = DEFAULT_PERCENT_TOLERANCE) -> List[int]:
+	currentArray: numpy.ndarray = numpy.asarray(currents, dtype=numpy.float64)
+	outOfBand: numpy.ndarray = OutOfBandMask(currentArray, roll, percentTolerance)
+
+	#n should NOT be included, so each step ends on the row before the breakpoint
+	sliceIndices: List[int] = [n - 1 for n in SelectBreakpoints(outOfBand, roll * 2, roll * 2)]
+
+	sliceIndices.append(currentArray.size - ENDPOINT_OFFSET) #need an index for the endpoint as well
+	return sliceIndices
+
+
+#Step detection over a series that arrives in chunks, e.g. while streaming a long experiment or watching a running one
+#Feeding the whole series through this class gives exactly the same indices as DetectSteps
+class IncrementalStepDetector(object):
+	"""
+	Member variables:
+
+	int roll;
+	float percentTolerance;
+	int size;
+	int nextAllowed;
+	numpy.ndarray tail;
+	"""
+
+	def __init__(self, roll: int = DEFAULT_ROLL, percentTolerance: float = DEFAULT_PERCENT_TOLERANCE) -> None:
+		self.roll: int = roll
+		self.percentTolerance: float = percentTolerance
+		#Number of values fed so far
+		self.size: int = 0
+		#First index at which a new breakpoint may be detected
+		self.nextAllowed: int = roll * 2
+		#The last (roll - 1) values, which are needed for the rolling median at the start of the next chunk
+		self.tail: numpy.ndarray = numpy.empty(0, dtype=numpy.float64)
+
+	#Appends a chunk of currents and returns the slice indices (as positions in the whole series) of any steps that ended within it
+	def Feed(self, currents) -> List[int]:
+		chunk: numpy.ndarray = numpy.asarray(currents, dtype=numpy.float64)
+		extended: numpy.ndarray = numpy.concatenate((self.tail, chunk))
+		offset: int = self.size - self.tail.size #Position of extended[0] in the whole series
+
+		outOfBand: numpy.ndarray = OutOfBandMask(extended, self.roll, self.percentTolerance)
+		breakpoints: List[int] = [n + offset for n in SelectBreakpoints(outOfBand, max(self.nextAllowed - offset, 0), self.roll * 2)]
+		if breakpoints:
+			self.nextAllowed = breakpoints[-1] + self.roll * 2 + 1
+
+		self.size += chunk.size
+		self.tail = extended[max(extended.size - (self.roll - 1), 0):]
+		return [n - 1 for n in breakpoints]
+
+	#Returns the index used for the endpoint of the series
+	def EndpointIndex(self) -> int:
+		return self.size - ENDPOINT_OFFSET
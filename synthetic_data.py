@@ -0,0 +1,51 @@
+from typing import List
+import numpy
+import pandas as pd
+
+#Generates realistic pivoted ED stand data, in the same format as the InfluxDB query, for benchmarking and offline testing
+#No credentials or network access are needed
+
+MEMBRANE_AREA: float = 0.0036 #m^2, matches EDMetrics
+CURRENT_DENSITIES: List[float] = [120.0, 200.0, 280.0, 360.0, 440.0, 520.0] #A m^-2
+AGGREGATION_WINDOW: int = 10 #s
+
+#Returns a DataFrame with one row per aggregation window and the columns EDMetrics needs
+#The current steps through the usual current densities (repeating if there are more steps than densities), and the other channels respond to it
+def GenerateExperiment(hours: float = 6.0, steps: int = 6, noise: float = 0.01, seed: int = 0, startTime: float = 1688169600.0) -> pd.DataFrame:
+	rng: numpy.random.Generator = numpy.random.default_rng(seed)
+	rows: int = max(int(hours * 3600 / AGGREGATION_WINDOW), 1)
+
+	#Timestamps are UTC and mark the end of each aggregation window, as they do when queried from InfluxDB
+	times: pd.DatetimeIndex = pd.date_range(pd.Timestamp(startTime + AGGREGATION_WINDOW, unit="s", tz="UTC"), periods=rows, freq="%ds" % AGGREGATION_WINDOW)
+
+	#Current density setpoint of each row
+	stepOfRow: numpy.ndarray = numpy.minimum(numpy.arange(rows) * steps // rows, steps - 1)
+	setpoints: numpy.ndarray = numpy.asarray(CURRENT_DENSITIES)[stepOfRow % len(CURRENT_DENSITIES)] * MEMBRANE_AREA
+
+	#The current settles towards each new setpoint over a few rows
+	current: numpy.ndarray = pd.Series(setpoints).ewm(span=3).mean().to_numpy()
+	current = current * (1.0 + rng.normal(0.0, noise, rows))
+
+	#Stack resistance drifts slowly upwards over the experiment
+	resistance: numpy.ndarray = 4.0 + numpy.linspace(0.0, 0.5, rows) + rng.normal(0.0, noise, rows)
+	voltage: numpy.ndarray = 1.5 + current * resistance
+
+	#CO2 evolution is roughly proportional to current, with a current efficiency that falls at high current
+	airFlow: numpy.ndarray = 1.0 + rng.normal(0.0, noise * 0.1, rows) #L min^-1
+	currentEfficiency: numpy.ndarray = 0.8 - 0.2 * (current / current.max())
+	co2LitresPerSecond: numpy.ndarray = currentEfficiency * current * 10.0 / 96485.0 * 44.01 / 1.815
+	co2PPM: numpy.ndarray = co2LitresPerSecond / (airFlow / 60.0) * 1.0e6 * (1.0 + rng.normal(0.0, noise, rows))
+
+	#Capture pH falls slowly as CO2 is released
+	pH: numpy.ndarray = 9.5 - numpy.cumsum(current) * (1.5 / max(numpy.sum(current), 1e-9)) + rng.normal(0.0, noise * 0.1, rows)
+
+	return pd.DataFrame({
+		"result" : "_result",
+		"table" : 0,
+		"_time" : times,
+		"current_PSU001" : current,
+		"voltage_PSU001" : voltage,
+		"CO2_PPM_CO2001" : co2PPM,
+		"volumetric_flow_MFM001" : airFlow,
+		"pH_PH002" : pH
+	})
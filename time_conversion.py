@@ -0,0 +1,27 @@
+import numpy
+import pandas as pd
+from dateutil import tz
+
+
+#Converts a column (or index) of timestamps to float UNIX timestamps in seconds, in one vectorized operation
+#Timezone-aware timestamps (e.g. the UTC "_time" column returned by InfluxDB) are converted exactly
+#Naive timestamps are interpreted as local time, matching the behaviour of time.mktime()
+#Columns of separate timestamps (e.g. Notion date cells) may have different UTC offsets, such as either side of a DST change, or mix aware and naive values. Each group is then converted on its own
+def ToEpochSeconds(timestamps) -> numpy.ndarray:
+	timestamps = pd.Index(timestamps)
+	if not isinstance(timestamps, pd.DatetimeIndex):
+		timestamps = pd.Index([pd.Timestamp(value) for value in timestamps], dtype=object)
+		aware: numpy.ndarray = numpy.array([pd.notna(value) and value.tzinfo is not None for value in timestamps], dtype=bool)
+		op: numpy.ndarray = numpy.full(len(timestamps), numpy.nan)
+		if aware.any():
+			op[aware] = ToEpochSeconds(pd.to_datetime(timestamps[aware], utc=True))
+		if not aware.all():
+			op[~aware] = ToEpochSeconds(pd.DatetimeIndex(timestamps[~aware]))
+		return op
+
+	if timestamps.tz is None:
+		timestamps = timestamps.tz_localize(tz.tzlocal(), ambiguous="NaT", nonexistent="shift_forward")
+	#Convert to nanoseconds since the epoch, then to seconds
+	nanoseconds: numpy.ndarray = timestamps.as_unit("ns").asi8.astype(numpy.float64)
+	nanoseconds[timestamps.isna()] = numpy.nan
+	return nanoseconds / 1.0e9
@@ -0,0 +1,57 @@
+from typing import Tuple
+import numpy
+
+#Arrays of values with uncertainties, for calculating a metric for every data window at once
+#Errors are combined as in EDMetrics.ErrorMultiply() and EDMetrics.ErrorDivide(): the relative errors of the operands are added
+
+
+class UncertainArray(object):
+	"""
+	Member variables:
+
+	numpy.ndarray values;
+	numpy.ndarray errors;
+	"""
+
+	def __init__(self, values, errors=0.0) -> None:
+		self.values: numpy.ndarray = numpy.asarray(values, dtype=numpy.float64)
+		self.errors: numpy.ndarray = numpy.broadcast_to(numpy.asarray(errors, dtype=numpy.float64), self.values.shape)
+
+	#Plain numbers are exact, i.e. they have an error of 0
+	@staticmethod
+	def Coerce(other) -> "UncertainArray":
+		if isinstance(other, UncertainArray):
+			return other
+		return UncertainArray(other, 0.0)
+
+	def __len__(self) -> int:
+		return self.values.size
+
+	#Division by 0 gives inf or NaN rather than raising, and is picked up by Invalid()
+	def __mul__(self, other) -> "UncertainArray":
+		other = self.Coerce(other)
+		with numpy.errstate(divide="ignore", invalid="ignore"):
+			values: numpy.ndarray = self.values * other.values
+			relativeErrors: numpy.ndarray = (self.errors / self.values) + (other.errors / other.values)
+			return UncertainArray(values, values * relativeErrors)
+
+	def __truediv__(self, other) -> "UncertainArray":
+		other = self.Coerce(other)
+		with numpy.errstate(divide="ignore", invalid="ignore"):
+			values: numpy.ndarray = self.values / other.values
+			relativeErrors: numpy.ndarray = (self.errors / self.values) + (other.errors / other.values)
+			return UncertainArray(values, values * relativeErrors)
+
+	#Returns a boolean array that is True wherever the value or its error is NaN
+	def Invalid(self) -> numpy.ndarray:
+		return numpy.isnan(self.values) | numpy.isnan(self.errors)
+
+	#Returns a copy with the values and errors of the masked elements set to fill
+	def Masked(self, mask: numpy.ndarray, fill: float = 0.0) -> "UncertainArray":
+		return UncertainArray(numpy.where(mask, fill, self.values), numpy.where(mask, fill, self.errors))
+
+	#Returns the (value, error) tuple of one element, or of a 0-dimensional array
+	def ToTuple(self, index: int = None) -> Tuple[float, float]:
+		if index is None:
+			return (self.values[()], self.errors[()])
+		return (self.values[index], self.errors[index])
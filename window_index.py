@@ -0,0 +1,42 @@
+from typing import List, Tuple
+from datetime import timedelta
+import numpy
+import pandas as pd
+
+#Length of the data window used to calculate the key metrics at the end of each current density step
+WINDOW_LENGTH: timedelta = timedelta(minutes=5)
+
+
+#Returns the timestamps of a DataFrame as int64 nanoseconds, sorting the DataFrame by time first if needed
+def SortedTimes(rawData: pd.DataFrame) -> Tuple[pd.DataFrame, numpy.ndarray]:
+	if not rawData["_time"].is_monotonic_increasing:
+		rawData = rawData.sort_values("_time", ignore_index=True)
+	return (rawData, pd.DatetimeIndex(rawData["_time"]).as_unit("ns").asi8)
+
+
+#For each end row, finds the positional bounds [start, stop) of the rows whose timestamps lie within WINDOW_LENGTH before it, inclusive of both ends
+#Uses binary search, so all windows are found in O(windows * log(rows)) without building any boolean masks
+def WindowBounds(times: numpy.ndarray, endIndices: List[int], windowLength: timedelta = WINDOW_LENGTH) -> Tuple[numpy.ndarray, numpy.ndarray]:
+	endTimes: numpy.ndarray = times[numpy.asarray(endIndices, dtype=numpy.int64)]
+	windowNanoseconds: int = int(windowLength / timedelta(microseconds=1)) * 1000
+	starts: numpy.ndarray = numpy.searchsorted(times, endTimes - windowNanoseconds, side="left")
+	stops: numpy.ndarray = numpy.searchsorted(times, endTimes, side="right")
+	return (starts, stops)
+
+
+#Returns a positional slice for the window ending at each end row. Applying them with .iloc gives views rather than copies
+#End indices that fall outside of the data (e.g. the endpoint of an experiment with fewer than 5 rows) are skipped
+def WindowSlices(times: numpy.ndarray, endIndices: List[int]) -> List[slice]:
+	validIndices: List[int] = [ind for ind in endIndices if 0 <= ind < times.size]
+	if not validIndices:
+		return []
+	starts, stops = WindowBounds(times, validIndices)
+	return [slice(int(start), int(stop)) for start, stop in zip(starts, stops)]
+
+
+#Returns the time range [start, stop] in int64 nanoseconds of the window ending at each end row, for sources that calculate window statistics themselves
+#End indices that fall outside of the data are skipped, as in WindowSlices()
+def WindowTimeRanges(times: numpy.ndarray, endIndices: List[int], windowLength: timedelta = WINDOW_LENGTH) -> List[Tuple[int, int]]:
+	validIndices: List[int] = [ind for ind in endIndices if 0 <= ind < times.size]
+	windowNanoseconds: int = int(windowLength / timedelta(microseconds=1)) * 1000
+	return [(int(times[ind]) - windowNanoseconds, int(times[ind])) for ind in validIndices]